@@ -1,22 +1,41 @@
 # backend.py
-from fastapi import FastAPI, HTTPException, Depends, status, Query
-from datetime import datetime
-import asyncio, random
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Query, Header
+from datetime import datetime, timedelta, timezone
+import asyncio, random, logging, os, re
 from typing import Optional, List
 from fastapi.middleware.cors import CORSMiddleware
 
-from db_config import get_db, engine
-from models import Airline, Reservation, Booking, FareHistory
-from pricing_engine import calculate_dynamic_price
-from utils import generate_pnr, flight_duration_minutes
+from db_config import SessionLocal, get_db, get_async_db, engine, async_engine, pool_metrics, DB_ASYNC
+from models import Airline, Reservation, Booking
+from pricing_engine import calculate_dynamic_price, calculate_dynamic_prices
+from utils import flight_duration_minutes
+from pnr_allocator import pnr_allocator
+from seat_inventory import seat_inventory
+from seat_counter import take_seats, return_seats, is_lock_conflict, SeatConflict, OPTIMISTIC_SEATS, SEAT_CONFLICT_RETRIES
+from search_cache import search_cache
+from quote_store import quote_store, InvalidQuote
+from route_graph import route_graph, ROUTE_MIN_LAYOVER_MINUTES
+from flight_snapshot import flight_snapshot
+from provider_feed import provider_feeds
+from market_simulator import simulate_market_step, MARKET_INTERVAL_SECONDS, MARKET_FEED_MAX_IDS
+from booking_sweeper import expire_pending_bookings, BOOKING_HOLD_MINUTES, SWEEP_INTERVAL_SECONDS
+from fare_store import fare_buffer, fare_series, prune_fare_history, FARE_FLUSH_SECONDS, FARE_PRUNE_SECONDS
+from receipt_service import receipt_service, booking_receipt, reservation_receipt, receipt_etag
+from instrumentation import InstrumentationMiddleware, instrument_engine, metrics, METRICS_ENABLED
+from pagination import keyset_page, ndjson_stream, column_dict, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from coordination import coordinator, COORDINATION_POLL_SECONDS
+from name_index import booking_names, reservation_names, NAME_INDEX, NAME_INDEX_MAX_CANDIDATES
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, select
+from sqlalchemy import func, select, insert
+from sqlalchemy.exc import IntegrityError, OperationalError
 
+from fastapi import Response
 from fastapi.responses import StreamingResponse
 from io import BytesIO
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
+import gzip, hashlib, zipfile
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Airline Modular Backend (full features)")
 
@@ -27,8 +46,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Paging cursors and feed versions travel in headers the browser hides unless exposed
+    expose_headers=["X-Next-Cursor", "ETag", "X-Feed-Version", "X-Feed-Records"],
 )
 
+if METRICS_ENABLED:
+    app.add_middleware(InstrumentationMiddleware)
+    instrument_engine(engine)
+    if async_engine is not None:
+        instrument_engine(async_engine.sync_engine)
+
 @app.get("/")
 def root():
     return {"message": "Airline modular backend running"}
@@ -42,31 +69,76 @@ def health():
     except Exception:
         return {"status": "ok", "db_connected": False}
 
+@app.get("/health/pool")
+def pool_health():
+    """Live connection pool metrics for this worker process."""
+    metrics = {"pid": os.getpid(), "sync": pool_metrics(engine)}
+    if async_engine is not None:
+        metrics["async"] = pool_metrics(async_engine)
+    return metrics
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Request, SQL and hot-path metrics for this worker in the Prometheus text format."""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/coordination/stats")
+def coordination_stats():
+    """Leadership and invalidation message counters for this worker."""
+    return coordinator.stats()
+
+# Seat and route changes are applied to this worker's caches first, then
+# broadcast so the other workers drop the same entries
+def _apply_flight_change(airline_id, origin_city, destination_city, taken=(), released=()):
+    search_cache.invalidate_route(origin_city, destination_city)
+    quote_store.invalidate(airline_id)
+    route_graph.mark_changed(airline_id)
+    flight_snapshot.mark_changed(airline_id)
+    seat_inventory.apply(airline_id, taken, released)
+
+def _apply_market_tick(changed, airline_ids=None):
+    search_cache.clear()
+    quote_store.invalidate()
+    if airline_ids is None:  # too many to list: reload everything
+        route_graph.mark_all_changed()
+        flight_snapshot.mark_all_changed()
+    else:
+        route_graph.mark_changed(*airline_ids)
+        flight_snapshot.mark_changed(*airline_ids)
+
+def flight_changed(airline_id, origin_city, destination_city, taken=(), released=()):
+    # This worker's seat map already holds these seats; replaying them could
+    # re-take a seat a concurrent cancellation has just released
+    _apply_flight_change(airline_id, origin_city, destination_city)
+    coordinator.publish("flight", airline_id=airline_id, origin_city=origin_city,
+                        destination_city=destination_city, taken=list(taken), released=list(released))
+
+coordinator.subscribe("flight", _apply_flight_change)
+coordinator.subscribe("market_tick", _apply_market_tick)
+
 @app.get("/flights")
-def get_all_flights(db: Session = Depends(get_db)):
-    return db.query(Airline).all()
+def get_all_flights(response: Response, after: Optional[int] = None,
+                    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                    format: Optional[str] = Query(None, regex="^ndjson$"),
+                    db: Session = Depends(get_db)):
+    if flight_snapshot.enabled:
+        snapshot = flight_snapshot.ensure_fresh(db)
+        if format == "ndjson":
+            return StreamingResponse(snapshot.flights_ndjson(after), media_type="application/x-ndjson")
+        body, next_cursor = snapshot.flights_page(after, limit)
+        headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else None
+        return Response(body, media_type="application/json", headers=headers)
+    if format == "ndjson":
+        return ndjson_stream(lambda s: s.query(Airline), Airline.airline_id, after, column_dict)
+    return keyset_page(db.query(Airline), Airline.airline_id, after, limit, response, column_dict)
 
-@app.get("/search")
-def search_flights(origin_city: str, destination_city: str,
-                   departure_time: Optional[str] = None,
-                   sort_by: Optional[str] = Query(None, regex="^(price|duration)$"),
-                   db: Session = Depends(get_db)):
-    query = db.query(Airline).filter(Airline.origin_city == origin_city,
-                                     Airline.destination_city == destination_city)
-    if departure_time:
-        try:
-            dt = datetime.strptime(departure_time, "%Y-%m-%d")
-            query = query.filter(func.date(Airline.departure_time) == dt.date())
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid departure_time format. Use YYYY-MM-DD")
-    flights = query.all()
-    if not flights:
-        raise HTTPException(status_code=404, detail="No matching flights found")
-    results = []
+def _search_rows(flights):
+    """Base rows for /search plus the flight ids and pricing inputs, without the dynamic price."""
+    rows, bases = [], []
     for f in flights:
         base = float(f.ticket_price) if f.ticket_price is not None else 0.0
-        dyn = calculate_dynamic_price(base, f.available_seats or 0, f.capacity or 1, f.departure_time)
-        results.append({
+        bases.append(base)
+        rows.append({
             "airline_code": f.airline_code,
             "operator_name": f.operator_name,
             "origin_city": f.origin_city,
@@ -75,28 +147,194 @@ def search_flights(origin_city: str, destination_city: str,
             "arrival_time": f.arrival_time.strftime("%Y-%m-%d %H:%M:%S") if f.arrival_time else None,
             "available_seats": f.available_seats,
             "ticket_price": base,
-            "dynamic_price": dyn,
+            "dynamic_price": None,
             "duration_minutes": flight_duration_minutes(f.departure_time, f.arrival_time)
         })
+    pricing = (
+        bases,
+        [f.available_seats or 0 for f in flights],
+        [f.capacity or 1 for f in flights],
+        [f.departure_time for f in flights]
+    )
+    return rows, [f.airline_id for f in flights], pricing
+
+def _quotes_for(airline_ids, pricing):
+    """A live quote per flight: reuse unexpired ones, price the rest in one batch."""
+    quotes = [quote_store.live(airline_id) for airline_id in airline_ids]
+    missing = [i for i, quote in enumerate(quotes) if quote is None]
+    if missing:
+        prices = calculate_dynamic_prices(*([column[i] for i in missing] for column in pricing))
+        for i, price in zip(missing, prices.tolist()):
+            quotes[i] = quote_store.issue(airline_ids[i], price)
+    return quotes
+
+def _quoted_row(row, quote):
+    result = dict(row)
+    result["dynamic_price"] = quote.price
+    result["quote"] = quote.token
+    result["quote_expires_at"] = datetime.utcfromtimestamp(quote.expires_at).strftime("%Y-%m-%d %H:%M:%S")
+    return result
+
+def _search_day(departure_time: Optional[str]):
+    if not departure_time:
+        return None
+    try:
+        return datetime.strptime(departure_time, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid departure_time format. Use YYYY-MM-DD")
+
+@app.get("/search")
+def search_flights(origin_city: str, destination_city: str,
+                   departure_time: Optional[str] = None,
+                   sort_by: Optional[str] = Query(None, regex="^(price|duration)$"),
+                   db: Session = Depends(get_db)):
+    day = _search_day(departure_time)
+    if flight_snapshot.enabled:
+        snapshot = flight_snapshot.ensure_fresh(db)
+        positions = snapshot.route(origin_city, destination_city, day, sort_by)
+        if not len(positions):
+            raise HTTPException(status_code=404, detail="No matching flights found")
+        quotes = _quotes_for(*snapshot.pricing(positions))
+        if sort_by == "price":
+            order = sorted(range(len(quotes)), key=lambda i: quotes[i].price)
+            positions, quotes = positions[order], [quotes[i] for i in order]
+        return Response(snapshot.search_json(positions, quotes), media_type="application/json")
+    key = (origin_city, destination_city, day, sort_by)
+    cached = search_cache.get(key)
+    if cached is None:
+        generation = search_cache.generation(key)
+        query = db.query(Airline).filter(Airline.origin_city == origin_city,
+                                         Airline.destination_city == destination_city)
+        if day:
+            start = datetime.combine(day, datetime.min.time())
+            query = query.filter(Airline.departure_time >= start,
+                                 Airline.departure_time < start + timedelta(days=1))
+        flights = query.all()
+        if sort_by == "duration":
+            flights.sort(key=lambda f: flight_duration_minutes(f.departure_time, f.arrival_time))
+        cached = _search_rows(flights)
+        search_cache.put(key, cached, generation)
+    rows, airline_ids, pricing = cached
+    if not rows:
+        raise HTTPException(status_code=404, detail="No matching flights found")
+    results = [_quoted_row(row, quote) for row, quote in zip(rows, _quotes_for(airline_ids, pricing))]
     if sort_by == "price":
         results.sort(key=lambda x: x["dynamic_price"])
-    elif sort_by == "duration":
-        results.sort(key=lambda x: x["duration_minutes"])
     return results
 
+@app.get("/search/connections")
+def search_connections(origin_city: str, destination_city: str,
+                       departure_time: Optional[str] = None,
+                       max_stops: int = Query(2, ge=0, le=2),
+                       min_layover: int = Query(ROUTE_MIN_LAYOVER_MINUTES, ge=0, le=1440, description="minutes"),
+                       sort_by: str = Query("price", regex="^(price|duration)$"),
+                       limit: int = Query(20, ge=1, le=100),
+                       db: Session = Depends(get_db)):
+    """Direct flights and one/two-stop connections from the in-memory route graph, best first."""
+    day = _search_day(departure_time)
+    route_graph.ensure_fresh(db)
+    if not route_graph.ready:  # the first build failed; an empty graph would answer 404
+        raise HTTPException(status_code=503, detail="Route graph is loading, please retry")
+    itineraries = route_graph.connections(origin_city, destination_city, day, max_stops,
+                                          timedelta(minutes=min_layover))
+    if not itineraries:
+        raise HTTPException(status_code=404, detail="No matching connections found")
+    if sort_by == "duration":
+        itineraries.sort(key=lambda i: (i.duration_minutes, len(i.legs)))
+        itineraries = itineraries[:limit]
+    legs = list({leg.airline_id: leg for i in itineraries for leg in i.legs}.values())
+    rows, airline_ids, pricing = _search_rows(legs)
+    quoted = {airline_id: _quoted_row(row, quote)
+              for airline_id, row, quote in zip(airline_ids, rows, _quotes_for(airline_ids, pricing))}
+    results = [{
+        "stops": len(i.legs) - 1,
+        "total_price": round(sum(quoted[leg.airline_id]["dynamic_price"] for leg in i.legs), 2),
+        "total_duration_minutes": i.duration_minutes,
+        "layover_minutes": i.layover_minutes,
+        "legs": [quoted[leg.airline_id] for leg in i.legs],
+    } for i in itineraries]
+    if sort_by == "price":
+        results.sort(key=lambda r: (r["total_price"], r["total_duration_minutes"]))
+        results = results[:limit]
+    return results
+
+@app.get("/search/connections/stats")
+def route_graph_stats():
+    return route_graph.stats()
+
+@app.get("/flights/snapshot/stats")
+def flight_snapshot_stats():
+    return flight_snapshot.stats()
+
+@app.get("/search/cache/stats")
+def search_cache_stats():
+    """Only used with FLIGHT_SNAPSHOT=0; the snapshot serves /search otherwise."""
+    return {"enabled": not flight_snapshot.enabled, **search_cache.stats()}
+
+@app.get("/quotes/stats")
+def quote_stats():
+    return quote_store.stats()
+
+@app.get("/fares/buffer/stats")
+def fare_buffer_stats():
+    return fare_buffer.stats()
+
 @app.get("/dynamic_price/{airline_code}")
 def dynamic_price(airline_code: str, db: Session = Depends(get_db)):
-    flight = db.query(Airline).filter(Airline.airline_code == airline_code).first()
+    if flight_snapshot.enabled:
+        snapshot = flight_snapshot.ensure_fresh(db)
+        i = snapshot.code_index.get(airline_code)
+        if i is None:
+            raise HTTPException(status_code=404, detail="Flight not found")
+        airline_id, old_price, seats, capacity, departure = snapshot.fare_inputs(i)
+    else:
+        flight = db.query(Airline).filter(Airline.airline_code == airline_code).first()
+        if not flight:
+            raise HTTPException(status_code=404, detail="Flight not found")
+        airline_id, old_price = flight.airline_id, float(flight.ticket_price or 0.0)
+        seats, capacity, departure = flight.available_seats, flight.capacity, flight.departure_time
+    new_price = calculate_dynamic_price(old_price, seats, capacity, departure)
+    fare_buffer.record(airline_id, old_price, new_price)
+    return {"airline_code": airline_code, "dynamic_price": new_price, "base_price": old_price}
+
+# Default window per resolution when from= is omitted
+FARE_HISTORY_SPAN = {"minute": timedelta(hours=6), "hour": timedelta(days=7), "day": timedelta(days=90)}
+
+def _utc_naive(value):
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+@app.get("/fares/{airline_code}/history")
+def fare_history_series(airline_code: str,
+                        from_: Optional[datetime] = Query(None, alias="from"),
+                        to: Optional[datetime] = None,
+                        resolution: str = Query("hour", regex="^(minute|hour|day)$"),
+                        db: Session = Depends(get_db)):
+    """OHLC fare history of a flight from the minute/hour/day rollups (times in UTC)."""
+    flight = db.query(Airline.airline_id).filter(Airline.airline_code == airline_code).first()
     if not flight:
         raise HTTPException(status_code=404, detail="Flight not found")
-    old_price = float(flight.ticket_price or 0.0)
-    new_price = calculate_dynamic_price(old_price, flight.available_seats, flight.capacity, flight.departure_time)
-    db.add(FareHistory(flight_id=flight.airline_id, old_price=old_price, new_price=new_price))
-    db.commit()
-    return {"airline_code": airline_code, "dynamic_price": new_price, "base_price": old_price}
+    end = _utc_naive(to) or datetime.utcnow()
+    start = _utc_naive(from_) or end - FARE_HISTORY_SPAN[resolution]
+    if start >= end:
+        raise HTTPException(status_code=400, detail="from must be before to")
+    return {
+        "airline_code": airline_code,
+        "flight_id": flight.airline_id,
+        "resolution": resolution,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "points": fare_series(db, flight.airline_id, resolution, start, end),
+    }
 
 @app.get("/external_api/{provider}/flights/{airline_code}")
 def external_schedule_mock(provider: str, airline_code: str, db: Session = Depends(get_db)):
+    if flight_snapshot.enabled:
+        body = flight_snapshot.ensure_fresh(db).provider_body(provider, airline_code)
+        if body is None:
+            return {"provider": provider, "airline_code": airline_code, "status": "not_found"}
+        return Response(body, media_type="application/json")
     flight = db.query(Airline).filter(Airline.airline_code == airline_code).first()
     if not flight:
         return {"provider": provider, "airline_code": airline_code, "status": "not_found"}
@@ -113,6 +351,30 @@ def external_schedule_mock(provider: str, airline_code: str, db: Session = Depen
         "seats_left": flight.available_seats
     }
 
+@app.get("/external_api/{provider}/feed")
+def external_schedule_feed(provider: str,
+                           since: Optional[int] = Query(None, ge=0, description="X-Feed-Version of an earlier feed"),
+                           format: str = Query("ndjson", regex="^(ndjson|columns)$"),
+                           if_none_match: Optional[str] = Header(None),
+                           accept_encoding: Optional[str] = Header(None),
+                           db: Session = Depends(get_db)):
+    """Every flight for a provider in one gzipped body, or only those changed since an earlier feed."""
+    columns = flight_snapshot.ensure_fresh(db)
+    feed = provider_feeds.get(flight_snapshot, columns, provider, format, since)
+    headers = {"ETag": feed.etag, "X-Feed-Version": str(feed.version), "X-Feed-Records": str(feed.records),
+               "Vary": "Accept-Encoding"}
+    if _etag_matches(if_none_match, feed.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    if accept_encoding and "gzip" in accept_encoding:
+        headers["Content-Encoding"] = "gzip"
+        return Response(feed.body, media_type=media_type, headers=headers)
+    return Response(gzip.decompress(feed.body), media_type=media_type, headers=headers)
+
+@app.get("/external_api/feed/stats")
+def provider_feed_stats():
+    return provider_feeds.stats()
+
 # Legacy reservation model compatibility
 from pydantic import BaseModel
 from typing import Optional
@@ -154,7 +416,9 @@ def create_reservation(request: BookingRequest, db: Session = Depends(get_db)):
     )
     db.add(booking)
     db.commit()
+    flight_changed(flight.airline_id, flight.origin_city, flight.destination_city)
     db.refresh(booking)
+    reservation_names.add(booking.reservation_id, booking.passenger_name)
     return BookingResponse(
         reservation_id=booking.reservation_id,
         pnr=None,
@@ -167,52 +431,108 @@ def create_reservation(request: BookingRequest, db: Session = Depends(get_db)):
         price=None
     )
 
+PNR_INSERT_ATTEMPTS = 3
+
+# MySQL names the violated key in a 1062 error: ux_bookings_pnr (migration 005), or pnr before it;
+# SQLite names the column, PostgreSQL reports the constraint
+PNR_UNIQUE_KEYS = ("ux_bookings_pnr", "pnr")
+_mysql_duplicate_key = re.compile(r"for key '(?:\w+\.)?(\w+)'")
+
+def _is_pnr_conflict(e: IntegrityError) -> bool:
+    """True if the insert clashed with another booking's PNR (as opposed to a seat)."""
+    orig = e.orig
+    code = orig.args[0] if getattr(orig, "args", None) else None
+    if code == 1062:
+        key = _mysql_duplicate_key.search(str(orig.args[1]) if len(orig.args) > 1 else "")
+        return key is not None and key.group(1) in PNR_UNIQUE_KEYS
+    constraint = getattr(getattr(orig, "diag", None), "constraint_name", None)
+    if constraint is not None:
+        return constraint in PNR_UNIQUE_KEYS
+    return str(orig).startswith("UNIQUE constraint failed: bookings.pnr")
+
+def insert_with_unique_pnr(db: Session, booking):
+    """Flush a new booking; on the (rare) clash with an older random PNR, take the next one."""
+    for attempt in range(PNR_INSERT_ATTEMPTS):
+        try:
+            with db.begin_nested():
+                db.add(booking)
+            return
+        except IntegrityError as e:
+            if not _is_pnr_conflict(e) or attempt == PNR_INSERT_ATTEMPTS - 1:
+                raise
+            booking.pnr = pnr_allocator.next_pnr()
+
+def insert_rows_with_unique_pnrs(db: Session, rows):
+    """insert_with_unique_pnr for a batch of row dicts: the PNRs that clashed are replaced and the batch retried."""
+    for attempt in range(PNR_INSERT_ATTEMPTS):
+        try:
+            with db.begin_nested():
+                db.execute(insert(Booking.__table__), rows)
+            return
+        except IntegrityError as e:
+            if not _is_pnr_conflict(e) or attempt == PNR_INSERT_ATTEMPTS - 1:
+                raise
+            taken = set(db.scalars(select(Booking.pnr).where(Booking.pnr.in_([row["pnr"] for row in rows]))))
+            for row in rows:
+                if row["pnr"] in taken or not taken:  # nothing visible: the clash was with an uncommitted row
+                    row["pnr"] = pnr_allocator.next_pnr()
+
 class BookingCreateRequest(BaseModel):
     airline_code: str
     passenger_name: str
     contact_number: Optional[str] = None
     seat_number: Optional[int] = None
+    quote: Optional[str] = None  # token from /search; honoured at the quoted price until it expires
 
 @app.post("/bookings/create", response_model=BookingResponse, status_code=status.HTTP_201_CREATED)
 def create_booking_workflow(request: BookingCreateRequest, db: Session = Depends(get_db)):
+    pnr = pnr_allocator.next_pnr()  # before taking any lock; may lease a new block
+    return _create_booking_with_retries(request, pnr, db)
+
+def _create_booking_with_retries(request: BookingCreateRequest, pnr: str, db: Session):
+    # An auto-assigned seat that loses a race, or comes from a stale seat map (another
+    # worker booked it), is simply picked again from a reloaded map, in both seat modes
+    retries = SEAT_CONFLICT_RETRIES if not request.seat_number else 0
+    for attempt in range(retries + 1):
+        try:
+            return _create_booking(request, pnr, db)
+        except SeatConflict:
+            if attempt == retries:
+                raise HTTPException(status_code=409, detail="Seat was taken concurrently, please retry")
+
+def _create_booking(request: BookingCreateRequest, pnr: str, db: Session):
+    airline, seat_no = None, None
     try:
-        airline = db.query(Airline).filter(Airline.airline_code == request.airline_code).with_for_update().first()
+        query = db.query(Airline).filter(Airline.airline_code == request.airline_code)
+        airline = (query if OPTIMISTIC_SEATS else query.with_for_update()).first()
         if not airline:
             raise HTTPException(status_code=404, detail="Flight not found")
         if airline.available_seats is None or airline.available_seats <= 0:
             raise HTTPException(status_code=400, detail="No seats available")
-        seat_no = None
-        if request.seat_number:
-            existing = db.query(Booking).filter(
-                Booking.airline_id == airline.airline_id,
-                Booking.seat_number == request.seat_number,
-                Booking.status.in_(["CONFIRMED", "PAID", "PENDING"])
-            ).first()
-            if existing:
+        if request.seat_number and not 1 <= request.seat_number <= (airline.capacity or 1):
+            raise HTTPException(status_code=400, detail="Invalid seat number")
+        price = None
+        if request.quote:
+            try:
+                price = quote_store.verify(request.quote, airline.airline_id)
+            except InvalidQuote as e:
+                # Never fail a booking over a quote: it is priced afresh, as if none was sent
+                logger.info("Ignoring quote for %s: %s", airline.airline_code, e)
+        seat_no = seat_inventory.allocate(db, airline, request.seat_number)
+        if seat_no is None:
+            if request.seat_number:
                 raise HTTPException(status_code=400, detail="Requested seat already taken")
-            seat_no = request.seat_number
-        else:
-            taken_rows = db.query(Booking.seat_number).filter(Booking.airline_id == airline.airline_id).all()
-            taken = {r[0] for r in taken_rows if r and r[0] is not None}
-            for c in range(1, (airline.capacity or 1) + 1):
-                if c not in taken:
-                    seat_no = c
-                    break
-            if seat_no is None:
-                raise HTTPException(status_code=500, detail="No seat assignable")
-        price = calculate_dynamic_price(
-            base_fare=float(airline.ticket_price or 0.0),
-            seats_available=max(0, airline.available_seats - 1),
-            capacity=airline.capacity,
-            departure_time=airline.departure_time
-        )
-        attempts = 0
-        pnr = generate_pnr()
-        while db.query(Booking).filter(Booking.pnr == pnr).first():
-            pnr = generate_pnr()
-            attempts += 1
-            if attempts > 10:
-                raise HTTPException(status_code=500, detail="Unable to generate unique PNR")
+            # The count says a seat is free but the map is full: another worker took
+            # seats this map has not seen, so reload it and let the caller retry
+            seat_inventory.invalidate(airline.airline_id)
+            raise SeatConflict()
+        if price is None:  # no quote, or it has expired or was not accepted
+            price = calculate_dynamic_price(
+                base_fare=float(airline.ticket_price or 0.0),
+                seats_available=max(0, airline.available_seats - 1),
+                capacity=airline.capacity,
+                departure_time=airline.departure_time
+            )
         new_booking = Booking(
             pnr=pnr,
             airline_id=airline.airline_id,
@@ -222,11 +542,18 @@ def create_booking_workflow(request: BookingCreateRequest, db: Session = Depends
             price=price,
             status="PENDING"
         )
-        airline.available_seats = max(0, airline.available_seats - 1)
-        db.add(new_booking)
-        db.flush()
+        if OPTIMISTIC_SEATS:
+            # The flight row is locked from here to the commit only
+            if not take_seats(db, airline.airline_id):
+                raise HTTPException(status_code=400, detail="No seats available")
+        else:
+            airline.available_seats = max(0, airline.available_seats - 1)
+        insert_with_unique_pnr(db, new_booking)
         db.commit()
+        flight_changed(airline.airline_id, airline.origin_city, airline.destination_city, taken=[seat_no])
+        seat_no = None  # committed, nothing to hand back on later errors
         db.refresh(new_booking)
+        booking_names.add(new_booking.booking_id, new_booking.passenger_name)
         return BookingResponse(
             reservation_id=None,
             pnr=new_booking.pnr,
@@ -240,11 +567,144 @@ def create_booking_workflow(request: BookingCreateRequest, db: Session = Depends
         )
     except HTTPException:
         db.rollback()
+        if seat_no is not None:
+            seat_inventory.release(airline.airline_id, seat_no)
         raise
+    except SeatConflict:
+        db.rollback()
+        raise
+    except IntegrityError:
+        db.rollback()
+        # Another process holds this seat; our map is stale, reload it next time
+        seat_inventory.invalidate(airline.airline_id)
+        raise SeatConflict()
     except Exception as e:
         db.rollback()
+        if seat_no is not None:
+            seat_inventory.release(airline.airline_id, seat_no)
+        if isinstance(e, OperationalError) and is_lock_conflict(e):
+            raise SeatConflict()
         raise HTTPException(status_code=500, detail=f"Booking failed: {e}")
 
+MAX_BATCH_PASSENGERS = 200
+
+class BatchPassenger(BaseModel):
+    passenger_name: str
+    contact_number: Optional[str] = None
+    seat_number: Optional[int] = None
+
+class BatchBookingRequest(BaseModel):
+    airline_code: str
+    passengers: List[BatchPassenger]
+    contiguous: bool = True
+
+class BatchBookingResponse(BaseModel):
+    airline_code: str
+    airline_id: int
+    status: str
+    total_price: float
+    bookings: List[BookingResponse]
+
+@app.post("/bookings/batch", response_model=BatchBookingResponse, status_code=status.HTTP_201_CREATED)
+def create_batch_booking(request: BatchBookingRequest, db: Session = Depends(get_db)):
+    """Book a group on one flight in one transaction: every passenger gets a seat or nobody does."""
+    count = len(request.passengers)
+    if not 1 <= count <= MAX_BATCH_PASSENGERS:
+        raise HTTPException(status_code=400, detail=f"A batch takes 1 to {MAX_BATCH_PASSENGERS} passengers")
+    requested = [p.seat_number for p in request.passengers]
+    wanted = [seat for seat in requested if seat]
+    if len(set(wanted)) != len(wanted):
+        raise HTTPException(status_code=400, detail="Duplicate seat numbers in request")
+    pnrs = [pnr_allocator.next_pnr() for _ in range(count)]
+    airline, seats = None, []
+    try:
+        query = db.query(Airline).filter(Airline.airline_code == request.airline_code)
+        airline = (query if OPTIMISTIC_SEATS else query.with_for_update()).first()
+        if not airline:
+            raise HTTPException(status_code=404, detail="Flight not found")
+        if (airline.available_seats or 0) < count:
+            raise HTTPException(status_code=400, detail=f"Only {airline.available_seats or 0} seats available")
+        invalid = [i for i, seat in enumerate(requested) if seat and not 1 <= seat <= (airline.capacity or 1)]
+        if invalid:
+            raise HTTPException(status_code=400, detail={"message": "Invalid seat number", "passengers": invalid})
+        seats, failed = seat_inventory.allocate_many(db, airline, requested, request.contiguous)
+        if failed:
+            raise HTTPException(status_code=400, detail={
+                "message": "Requested seats already taken" if wanted else "No seats assignable",
+                "passengers": [{"index": i, "passenger_name": request.passengers[i].passenger_name,
+                                "seat_number": requested[i]} for i in failed]
+            })
+        prices = calculate_dynamic_prices(
+            [float(airline.ticket_price or 0.0)] * count,
+            [max(0, airline.available_seats - 1 - i) for i in range(count)],
+            [airline.capacity] * count,
+            [airline.departure_time] * count
+        ).tolist()
+        rows = [{
+            "pnr": pnr,
+            "airline_id": airline.airline_id,
+            "passenger_name": p.passenger_name,
+            "contact_number": p.contact_number,
+            "seat_number": seat,
+            "price": price,
+            "status": "PENDING"
+        } for pnr, p, seat, price in zip(pnrs, request.passengers, seats, prices)]
+        if OPTIMISTIC_SEATS:
+            if not take_seats(db, airline.airline_id, count):
+                raise HTTPException(status_code=400, detail="Not enough seats available")
+        else:
+            airline.available_seats = airline.available_seats - count
+        insert_rows_with_unique_pnrs(db, rows)
+        pnrs = [row["pnr"] for row in rows]
+        booking_ids = dict(db.query(Booking.pnr, Booking.booking_id).filter(Booking.pnr.in_(pnrs)).all())
+        airline_id, airline_code = airline.airline_id, airline.airline_code
+        route = (airline.origin_city, airline.destination_city)
+        db.commit()
+        flight_changed(airline_id, *route, taken=seats)
+        seats = []  # committed, nothing to hand back on later errors
+        booking_names.add_many((booking_ids.get(row["pnr"]), row["passenger_name"]) for row in rows)
+        return BatchBookingResponse(
+            airline_code=airline_code,
+            airline_id=airline_id,
+            status="PENDING",
+            total_price=round(sum(prices), 2),
+            bookings=[BookingResponse(
+                reservation_id=None,
+                pnr=row["pnr"],
+                booking_id=booking_ids.get(row["pnr"]),
+                airline_code=airline_code,
+                airline_id=airline_id,
+                passenger_name=row["passenger_name"],
+                seat_number=row["seat_number"],
+                status=row["status"],
+                price=row["price"]
+            ) for row in rows]
+        )
+    except HTTPException:
+        db.rollback()
+        for seat in seats:
+            seat_inventory.release(airline.airline_id, seat)
+        raise
+    except IntegrityError:
+        db.rollback()
+        seat_inventory.invalidate(airline.airline_id)
+        raise HTTPException(status_code=409, detail="Seats were taken concurrently, please retry")
+    except Exception as e:
+        db.rollback()
+        for seat in seats:
+            seat_inventory.release(airline.airline_id, seat)
+        raise HTTPException(status_code=500, detail=f"Batch booking failed: {e}")
+
+def _return_seat(db: Session, airline_id: int):
+    """Give one seat back to the flight's counter; returns the flight for cache invalidation."""
+    if OPTIMISTIC_SEATS:
+        return_seats(db, airline_id)
+        return db.query(Airline).filter(Airline.airline_id == airline_id).first()
+    airline = db.query(Airline).filter(Airline.airline_id == airline_id).with_for_update().first()
+    if airline:
+        airline.available_seats = min(airline.capacity, (airline.available_seats or 0) + 1)
+    return airline
+
 @app.post("/bookings/{pnr}/pay")
 def pay_booking(pnr: str, db: Session = Depends(get_db)):
     try:
@@ -253,6 +713,8 @@ def pay_booking(pnr: str, db: Session = Depends(get_db)):
             raise HTTPException(status_code=404, detail="Booking not found")
         if booking.status == "PAID":
             return {"pnr": pnr, "success": True, "status": "PAID", "message": "Already paid"}
+        if booking.status == "EXPIRED":
+            raise HTTPException(status_code=400, detail="Booking hold expired, please book again")
         success = random.choice([True, True, False])
         if success:
             booking.status = "PAID"
@@ -260,10 +722,13 @@ def pay_booking(pnr: str, db: Session = Depends(get_db)):
             return {"pnr": pnr, "success": True, "status": booking.status, "message": "Payment successful"}
         else:
             booking.status = "FAILED"
-            airline = db.query(Airline).filter(Airline.airline_id == booking.airline_id).with_for_update().first()
-            if airline:
-                airline.available_seats = min(airline.capacity, (airline.available_seats or 0) + 1)
+            seat_no, booking.seat_number = booking.seat_number, None
+            airline = _return_seat(db, booking.airline_id)
             db.commit()
+            seat_inventory.release(booking.airline_id, seat_no)
+            if airline:
+                flight_changed(airline.airline_id, airline.origin_city, airline.destination_city,
+                               released=[seat_no] if seat_no else [])
             return {"pnr": pnr, "success": False, "status": booking.status, "message": "Payment failed"}
     except HTTPException:
         db.rollback()
@@ -277,7 +742,7 @@ def confirm_booking(pnr: str, db: Session = Depends(get_db)):
     booking = db.query(Booking).filter(Booking.pnr == pnr).with_for_update().first()
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
-    if booking.status in ["CANCELLED"]:
+    if booking.status in ["CANCELLED", "EXPIRED"]:
         raise HTTPException(status_code=400, detail=f"Cannot confirm booking in status {booking.status}")
     if booking.status == "PAID":
         return {"pnr": pnr, "status": booking.status, "message": "Already paid/confirmed"}
@@ -293,11 +758,16 @@ def cancel_booking(pnr: str, db: Session = Depends(get_db)):
             raise HTTPException(status_code=404, detail="Booking not found")
         if booking.status == "CANCELLED":
             return {"pnr": pnr, "status": booking.status, "message": "Already cancelled"}
+        if booking.status == "EXPIRED":
+            return {"pnr": pnr, "status": booking.status, "message": "Booking hold already expired"}
         booking.status = "CANCELLED"
-        airline = db.query(Airline).filter(Airline.airline_id == booking.airline_id).with_for_update().first()
-        if airline:
-            airline.available_seats = min(airline.capacity, (airline.available_seats or 0) + 1)
+        seat_no, booking.seat_number = booking.seat_number, None
+        airline = _return_seat(db, booking.airline_id)
         db.commit()
+        seat_inventory.release(booking.airline_id, seat_no)
+        if airline:
+            flight_changed(airline.airline_id, airline.origin_city, airline.destination_city,
+                           released=[seat_no] if seat_no else [])
         return {"pnr": pnr, "status": booking.status, "message": "Booking cancelled and seat restored"}
     except HTTPException:
         db.rollback()
@@ -306,47 +776,8 @@ def cancel_booking(pnr: str, db: Session = Depends(get_db)):
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Cancellation failed: {e}")
 
-@app.get("/bookings/{pnr}")
-def get_booking_by_pnr(pnr: str, db: Session = Depends(get_db)):
-    booking = db.query(Booking).filter(Booking.pnr == pnr).first()
-    if booking:
-        return {
-            "pnr": booking.pnr,
-            "booking_id": booking.booking_id,
-            "airline_id": booking.airline_id,
-            "passenger_name": booking.passenger_name,
-            "seat_number": booking.seat_number,
-            "price": float(booking.price) if booking.price is not None else None,
-            "status": booking.status,
-            "created_at": booking.created_at.strftime("%Y-%m-%d %H:%M:%S") if booking.created_at else None
-        }
-    if pnr.isdigit():
-        res = db.query(Reservation).filter(Reservation.reservation_id == int(pnr)).first()
-        if res:
-            return {
-                "reservation_id": res.reservation_id,
-                "transaction_id": res.transaction_id,
-                "airline_code": res.airline_code,
-                "passenger_name": res.passenger_name,
-                "seat_number": res.seat_number,
-            }
-    raise HTTPException(status_code=404, detail="Booking not found")
-
-@app.get("/bookings")
-def list_or_filter_bookings(pnr: Optional[str] = None, booking_id: Optional[int] = None,
-                           passenger_name: Optional[str] = None, airline_code: Optional[str] = None,
-                           db: Session = Depends(get_db)):
-    query = db.query(Booking)
-    if booking_id:
-        query = query.filter(Booking.booking_id == booking_id)
-    if pnr:
-        query = query.filter(Booking.pnr == pnr)
-    if passenger_name:
-        query = query.filter(Booking.passenger_name.ilike(f"%{passenger_name}%"))
-    if airline_code:
-        query = query.join(Airline).filter(Airline.airline_code == airline_code)
-    results = query.all()
-    return [{
+def _booking_dict(b):
+    return {
         "pnr": b.pnr,
         "booking_id": b.booking_id,
         "airline_id": b.airline_id,
@@ -355,7 +786,61 @@ def list_or_filter_bookings(pnr: Optional[str] = None, booking_id: Optional[int]
         "price": float(b.price) if b.price is not None else None,
         "status": b.status,
         "created_at": b.created_at.strftime("%Y-%m-%d %H:%M:%S") if b.created_at else None
-    } for b in results]
+    }
+
+def _reservation_dict(b):
+    return {
+        "reservation_id": b.reservation_id,
+        "transaction_id": b.transaction_id,
+        "airline_code": b.airline_code,
+        "origin_city": b.origin_city,
+        "destination_city": b.destination_city,
+        "passenger_name": b.passenger_name,
+        "contact_number": b.contact_number,
+        "seat_number": b.seat_number
+    }
+
+def _name_pattern(passenger_name, name_match):
+    return f"{passenger_name}%" if name_match == "prefix" else f"%{passenger_name}%"
+
+def _name_candidates(index, db, passenger_name, name_match, after, narrowed):
+    """Ids the name index says can match (None: filter by ILIKE alone).
+
+    With other filters (`narrowed`) a very common name fragment is cheaper
+    to scan for than to look up candidate by candidate.
+    """
+    if not NAME_INDEX or not passenger_name or not index.ensure_fresh(db):
+        return None  # also while the index is still being built
+    candidates = index.search(passenger_name, prefix=name_match == "prefix", after=after)
+    if candidates is not None and narrowed and len(candidates) > NAME_INDEX_MAX_CANDIDATES:
+        return None
+    return candidates
+
+@app.get("/bookings")
+def list_or_filter_bookings(response: Response, pnr: Optional[str] = None, booking_id: Optional[int] = None,
+                           passenger_name: Optional[str] = None, airline_code: Optional[str] = None,
+                           name_match: str = Query("substring", regex="^(substring|prefix)$"),
+                           after: Optional[int] = None,
+                           limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                           format: Optional[str] = Query(None, regex="^ndjson$"),
+                           db: Session = Depends(get_db)):
+    def build_query(db):
+        query = db.query(Booking)
+        if booking_id:
+            query = query.filter(Booking.booking_id == booking_id)
+        if pnr:
+            query = query.filter(Booking.pnr == pnr)
+        if passenger_name:
+            query = query.filter(Booking.passenger_name.ilike(_name_pattern(passenger_name, name_match)))
+        if airline_code:
+            query = query.join(Airline).filter(Airline.airline_code == airline_code)
+        return query
+    candidates = None
+    if not (booking_id or pnr):  # those are unique lookups already
+        candidates = _name_candidates(booking_names, db, passenger_name, name_match, after, bool(airline_code))
+    if format == "ndjson":
+        return ndjson_stream(build_query, Booking.booking_id, after, _booking_dict, candidates=candidates)
+    return keyset_page(build_query(db), Booking.booking_id, after, limit, response, _booking_dict, candidates)
 
 @app.delete("/cancel/{reservation_id}")
 def cancel_reservation(reservation_id: int, db: Session = Depends(get_db)):
@@ -367,117 +852,284 @@ def cancel_reservation(reservation_id: int, db: Session = Depends(get_db)):
         flight.available_seats = min(flight.capacity, (flight.available_seats or 0) + 1)
     db.delete(booking)
     db.commit()
+    reservation_names.discard(reservation_id)
+    if flight:
+        flight_changed(flight.airline_id, flight.origin_city, flight.destination_city)
     return {"message": f"Booking {reservation_id} cancelled successfully"}
 
 @app.get("/bookings/legacy")
-def get_all_legacy_reservations(db: Session = Depends(get_db)):
-    return db.query(Reservation).all()
+def get_all_legacy_reservations(response: Response, after: Optional[int] = None,
+                                limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                                format: Optional[str] = Query(None, regex="^ndjson$"),
+                                db: Session = Depends(get_db)):
+    if format == "ndjson":
+        return ndjson_stream(lambda s: s.query(Reservation), Reservation.reservation_id, after, column_dict)
+    return keyset_page(db.query(Reservation), Reservation.reservation_id, after, limit, response, column_dict)
 
 @app.get("/bookings/filter")
-def filter_bookings(reservation_id: Optional[int] = None, airline_code: Optional[str] = None,
+def filter_bookings(response: Response, reservation_id: Optional[int] = None, airline_code: Optional[str] = None,
                    origin_city: Optional[str] = None, destination_city: Optional[str] = None,
-                   passenger_name: Optional[str] = None, db: Session = Depends(get_db)):
-    query = db.query(Reservation)
-    if reservation_id:
-        query = query.filter(Reservation.reservation_id == reservation_id)
-    if airline_code:
-        query = query.filter(Reservation.airline_code == airline_code)
-    if origin_city:
-        query = query.filter(Reservation.origin_city == origin_city)
-    if destination_city:
-        query = query.filter(Reservation.destination_city == destination_city)
-    if passenger_name:
-        query = query.filter(Reservation.passenger_name.ilike(f"%{passenger_name}%"))
-    results = query.all()
-    if not results:
+                   passenger_name: Optional[str] = None,
+                   name_match: str = Query("substring", regex="^(substring|prefix)$"),
+                   after: Optional[int] = None,
+                   limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                   format: Optional[str] = Query(None, regex="^ndjson$"),
+                   db: Session = Depends(get_db)):
+    def build_query(db):
+        query = db.query(Reservation)
+        if reservation_id:
+            query = query.filter(Reservation.reservation_id == reservation_id)
+        if airline_code:
+            query = query.filter(Reservation.airline_code == airline_code)
+        if origin_city:
+            query = query.filter(Reservation.origin_city == origin_city)
+        if destination_city:
+            query = query.filter(Reservation.destination_city == destination_city)
+        if passenger_name:
+            query = query.filter(Reservation.passenger_name.ilike(_name_pattern(passenger_name, name_match)))
+        return query
+    candidates = None
+    if not reservation_id:
+        candidates = _name_candidates(reservation_names, db, passenger_name, name_match, after,
+                                      bool(airline_code or origin_city or destination_city))
+    if format == "ndjson":
+        return ndjson_stream(build_query, Reservation.reservation_id, after, _reservation_dict, candidates=candidates)
+    results = keyset_page(build_query(db), Reservation.reservation_id, after, limit, response, _reservation_dict,
+                          candidates)
+    if not results and after is None:
         raise HTTPException(status_code=404, detail="No matching bookings found")
-    return [{
-        "reservation_id": b.reservation_id,
-        "transaction_id": b.transaction_id,
-        "airline_code": b.airline_code,
-        "origin_city": b.origin_city,
-        "destination_city": b.destination_city,
-        "passenger_name": b.passenger_name,
-        "contact_number": b.contact_number,
-        "seat_number": b.seat_number
-    } for b in results]
+    return results
+
+@app.get("/bookings/name_index/stats")
+def name_index_stats():
+    """Passenger-name trigram indexes of this worker (bookings and legacy reservations)."""
+    return {"enabled": NAME_INDEX, "bookings": booking_names.stats(), "reservations": reservation_names.stats()}
+
+# Registered after /bookings/legacy and /bookings/filter so it does not capture them
+@app.get("/bookings/{pnr}")
+def get_booking_by_pnr(pnr: str, db: Session = Depends(get_db)):
+    booking = db.query(Booking).filter(Booking.pnr == pnr).first()
+    if booking:
+        return _booking_dict(booking)
+    if pnr.isdigit():
+        res = db.query(Reservation).filter(Reservation.reservation_id == int(pnr)).first()
+        if res:
+            return {
+                "reservation_id": res.reservation_id,
+                "transaction_id": res.transaction_id,
+                "airline_code": res.airline_code,
+                "passenger_name": res.passenger_name,
+                "seat_number": res.seat_number,
+            }
+    raise HTTPException(status_code=404, detail="Booking not found")
 
 @app.get("/bookings/{pnr}/receipt")
-def download_receipt(pnr: str, db: Session = Depends(get_db)):
-    """Generate and return a booking receipt PDF for a given PNR or legacy reservation."""
+def download_receipt(pnr: str, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    """Return the receipt PDF for a PNR or legacy reservation, rendered off the event loop and cached by content."""
     # Try modern booking first
-    booking = db.query(Booking).filter(Booking.pnr == pnr).first()
-    if not booking and pnr.isdigit():
-        booking = db.query(Reservation).filter(Reservation.reservation_id == int(pnr)).first()
+    row = (db.query(Booking, Airline)
+           .outerjoin(Airline, Airline.airline_id == Booking.airline_id)
+           .filter(Booking.pnr == pnr).first())
+    if row:
+        receipt = booking_receipt(*row)
+    else:
+        res = db.query(Reservation).filter(Reservation.reservation_id == int(pnr)).first() if pnr.isdigit() else None
+        if not res:
+            raise HTTPException(status_code=404, detail="Booking not found")
+        receipt = reservation_receipt(res)
 
-    if not booking:
-        raise HTTPException(status_code=404, detail="Booking not found")
+    etag = receipt_etag(*receipt)
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    etag, pdf = receipt_service.get(receipt)
+    return Response(
+        pdf,
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f"attachment; filename=receipt_{pnr}.pdf",
+            "ETag": etag,
+        },
+    )
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+@app.get("/flights/{airline_code}/receipts")
+def download_flight_receipts(airline_code: str, if_none_match: Optional[str] = Header(None), db: Session = Depends(get_db)):
+    """ZIP of the receipts for every live booking on a flight (the manifest), rendered in parallel."""
+    airline = db.query(Airline).filter(Airline.airline_code == airline_code).first()
+    if not airline:
+        raise HTTPException(status_code=404, detail="Flight not found")
+    bookings = (db.query(Booking)
+                .filter(Booking.airline_id == airline.airline_id, Booking.status.notin_(["CANCELLED", "FAILED", "EXPIRED"]))
+                .order_by(Booking.booking_id).all())
+    receipts = [booking_receipt(b, airline) for b in bookings]
+
+    etags = [receipt_etag(*r) for r in receipts]
+    manifest_etag = '"' + hashlib.sha256("".join(etags).encode()).hexdigest()[:32] + '"'
+    if _etag_matches(if_none_match, manifest_etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": manifest_etag})
 
     buffer = BytesIO()
-    pdf = canvas.Canvas(buffer, pagesize=A4)
-
-    pdf.setFont("Helvetica-Bold", 16)
-    pdf.drawString(200, 800, "Airline Booking Receipt")
-    pdf.setFont("Helvetica", 12)
-
-    y = 770
-    pdf.drawString(100, y, f"Generated On: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    y -= 20
-
-    # Handle modern Booking table
-    if hasattr(booking, "pnr"):
-        airline = db.query(Airline).filter(Airline.airline_id == booking.airline_id).first()
-        pdf.drawString(100, y, f"PNR: {booking.pnr}"); y -= 20
-        pdf.drawString(100, y, f"Passenger: {booking.passenger_name}"); y -= 20
-        pdf.drawString(100, y, f"Seat Number: {booking.seat_number}"); y -= 20
-        pdf.drawString(100, y, f"Status: {booking.status}"); y -= 20
-        pdf.drawString(100, y, f"Price: ₹{float(booking.price) if booking.price else 0.0}"); y -= 20
-        if airline:
-            pdf.drawString(100, y, f"Airline Code: {airline.airline_code}"); y -= 20
-            pdf.drawString(100, y, f"Route: {airline.origin_city} → {airline.destination_city}"); y -= 20
-            pdf.drawString(100, y, f"Departure: {airline.departure_time.strftime('%Y-%m-%d %H:%M:%S')}"); y -= 20
-            pdf.drawString(100, y, f"Arrival: {airline.arrival_time.strftime('%Y-%m-%d %H:%M:%S')}")
-    else:
-        # Legacy Reservation
-        pdf.drawString(100, y, f"Reservation ID: {booking.reservation_id}"); y -= 20
-        pdf.drawString(100, y, f"Transaction ID: {booking.transaction_id}"); y -= 20
-        pdf.drawString(100, y, f"Passenger: {booking.passenger_name}"); y -= 20
-        pdf.drawString(100, y, f"Airline Code: {booking.airline_code}"); y -= 20
-        pdf.drawString(100, y, f"Seat Number: {booking.seat_number}")
-
-    pdf.setFont("Helvetica-Oblique", 10)
-    pdf.drawString(100, 100, "Thank you for booking with our Airline Simulator!")
-    pdf.save()
-    buffer.seek(0)
-
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for (booking_pnr, _, _), (_, pdf) in zip(receipts, receipt_service.get_many(receipts)):
+            archive.writestr(f"receipt_{booking_pnr}.pdf", pdf)
+    return Response(
+        buffer.getvalue(),
+        media_type="application/zip",
         headers={
-            "Content-Disposition": f"attachment; filename=receipt_{pnr}.pdf"
+            "Content-Disposition": f"attachment; filename=receipts_{airline_code}.zip",
+            "ETag": manifest_etag,
         },
     )
 
-# Background market simulator
-def simulate_market_step_once():
-    db = next(get_db())
-    flights = db.query(Airline).all()
-    for f in flights:
-        change = random.choice([-2, -1, 0, 0, 1])
-        new_avail = max(0, min(f.capacity or 0, (f.available_seats or 0) + change))
-        if new_avail != (f.available_seats or 0):
-            old_price = float(f.ticket_price or 0.0)
-            f.available_seats = new_avail
-            new_price = calculate_dynamic_price(old_price, f.available_seats, f.capacity or 1, f.departure_time)
-            db.add(FareHistory(flight_id=f.airline_id, old_price=old_price, new_price=new_price, changed_at=datetime.utcnow()))
-    db.commit()
-    db.close()
+@app.get("/bookings/expiry/stats")
+def booking_expiry_stats():
+    """Runs of the PENDING-booking sweeper in this worker (it only runs on the leader)."""
+    return last_sweep
+
+@app.get("/receipts/cache/stats")
+def receipt_cache_stats():
+    return receipt_service.stats()
+
+# Async database path: with DB_ASYNC=1 the hot booking-funnel endpoints run on
+# an AsyncSession, so a request waiting on MySQL no longer holds a threadpool
+# worker. The handler bodies are shared with the sync endpoints via run_sync,
+# which runs them on the event loop thread: work that blocks outside the
+# session (PNR block leases, snapshot rebuilds) is done first in a thread, and
+# coordinator.publish hands its backend write to the executor on its own.
+async_router = APIRouter()
 
-async def market_scheduler(interval_seconds: int = 300):
+def _refresh_snapshot():
+    db = SessionLocal()
+    try:
+        flight_snapshot.ensure_fresh(db)
+    finally:
+        db.close()
+
+@async_router.get("/search")
+async def search_flights_async(origin_city: str, destination_city: str,
+                               departure_time: Optional[str] = None,
+                               sort_by: Optional[str] = Query(None, regex="^(price|duration)$"),
+                               db=Depends(get_async_db)):
+    if flight_snapshot.enabled:
+        await asyncio.to_thread(_refresh_snapshot)
+    return await db.run_sync(lambda s: search_flights(origin_city, destination_city, departure_time, sort_by, s))
+
+@async_router.post("/bookings/create", response_model=BookingResponse, status_code=status.HTTP_201_CREATED)
+async def create_booking_workflow_async(request: BookingCreateRequest, db=Depends(get_async_db)):
+    pnr = await asyncio.to_thread(pnr_allocator.next_pnr)
+    return await db.run_sync(lambda s: _create_booking_with_retries(request, pnr, s))
+
+@async_router.post("/bookings/{pnr}/pay")
+async def pay_booking_async(pnr: str, db=Depends(get_async_db)):
+    return await db.run_sync(lambda s: pay_booking(pnr, s))
+
+@async_router.get("/bookings/{pnr}")
+async def get_booking_by_pnr_async(pnr: str, db=Depends(get_async_db)):
+    return await db.run_sync(lambda s: get_booking_by_pnr(pnr, s))
+
+if DB_ASYNC:
+    # Swap each sync route for its async twin in place, keeping route order
+    twins = {(r.path, frozenset(r.methods)): r for r in async_router.routes}
+    app.router.routes[:] = [twins.get((getattr(r, "path", None), frozenset(getattr(r, "methods", None) or ())), r)
+                            for r in app.router.routes]
+
+# Background market simulator; with several workers only the leader runs it
+async def market_scheduler(interval_seconds: int = MARKET_INTERVAL_SECONDS):
+    while True:
+        try:
+            if await asyncio.to_thread(coordinator.lead):
+                stats = await asyncio.to_thread(simulate_market_step)
+                if stats["changed"]:
+                    quote_store.invalidate()  # fares moved: the next search quotes the new ones
+                    ids = stats["airline_ids"]
+                    coordinator.publish("market_tick", changed=stats["changed"],
+                                        airline_ids=ids if len(ids) <= MARKET_FEED_MAX_IDS else None)
+        except Exception:
+            logger.exception("Market simulation tick failed")
+        await asyncio.sleep(interval_seconds)
+
+# Expires PENDING bookings left unpaid past BOOKING_HOLD_MINUTES; leader only, like the market
+last_sweep = {"hold_minutes": BOOKING_HOLD_MINUTES, "interval_seconds": SWEEP_INTERVAL_SECONDS,
+              "runs": 0, "expired_total": 0, "last_run": None}
+
+def sweep_expired_bookings():
+    stats = expire_pending_bookings()
+    for flight in stats["released"]:
+        seat_inventory.apply(flight["airline_id"], released=flight["seats"])
+        flight_changed(flight["airline_id"], flight["origin_city"], flight["destination_city"],
+                       released=flight["seats"])
+    metrics.inc("bookings_expired_total", value=stats["expired"])
+    last_sweep["runs"] += 1
+    last_sweep["expired_total"] += stats["expired"]
+    last_sweep["last_run"] = {"at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                              **{k: stats[k] for k in ("expired", "flights", "batches", "seconds")}}
+    return stats
+
+async def booking_sweeper(interval_seconds: float = SWEEP_INTERVAL_SECONDS):
     while True:
-        await asyncio.to_thread(simulate_market_step_once)
         await asyncio.sleep(interval_seconds)
+        try:
+            if await asyncio.to_thread(coordinator.lead):
+                await asyncio.to_thread(sweep_expired_bookings)
+        except Exception:
+            logger.exception("Booking expiry sweep failed")
+
+# Builds the passenger-name indexes in the background; lookups scan with ILIKE until it is done
+def warm_name_indexes():
+    db = SessionLocal()
+    try:
+        for index in (booking_names, reservation_names):
+            index.build(db)
+    except Exception:
+        logger.exception("Building passenger-name indexes failed")
+    finally:
+        db.close()
+
+# Renews (or takes over) leadership and applies other workers' invalidations
+async def coordination_scheduler(poll_seconds: float = COORDINATION_POLL_SECONDS):
+    while True:
+        try:
+            await asyncio.to_thread(coordinator.heartbeat)
+        except Exception:
+            logger.exception("Coordination heartbeat failed")
+        await asyncio.sleep(poll_seconds)
+
+# Writes buffered fare ticks every few seconds and prunes old history hourly
+async def fare_store_scheduler(flush_seconds: float = FARE_FLUSH_SECONDS, prune_seconds: float = FARE_PRUNE_SECONDS):
+    loop = asyncio.get_running_loop()
+    last_prune = loop.time()
+    while True:
+        await asyncio.sleep(flush_seconds)
+        try:
+            await asyncio.to_thread(fare_buffer.flush)
+        except Exception:
+            logger.exception("Fare tick flush failed")
+        if loop.time() - last_prune >= prune_seconds and coordinator.is_leader:
+            last_prune = loop.time()
+            try:
+                await asyncio.to_thread(prune_fare_history)
+            except Exception:
+                logger.exception("Fare history pruning failed")
 
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(market_scheduler(interval_seconds=300))
\ No newline at end of file
+    asyncio.create_task(coordination_scheduler())
+    asyncio.create_task(market_scheduler())
+    asyncio.create_task(booking_sweeper())
+    asyncio.create_task(fare_store_scheduler())
+    if NAME_INDEX:
+        asyncio.create_task(asyncio.to_thread(warm_name_indexes))
+
+@app.on_event("shutdown")
+def shutdown_event():
+    coordinator.resign()
+    receipt_service.shutdown()
+    try:
+        fare_buffer.flush()
+    except Exception:
+        logger.exception("Final fare tick flush failed")
\ No newline at end of file
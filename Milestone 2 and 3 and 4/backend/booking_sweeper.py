@@ -0,0 +1,97 @@
+# booking_sweeper.py
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, case, select, update
+
+from db_config import SessionLocal
+from models import Airline, Booking
+
+logger = logging.getLogger(__name__)
+
+BOOKING_HOLD_MINUTES = float(os.getenv("BOOKING_HOLD_MINUTES", "15"))  # unpaid PENDING bookings expire after this
+SWEEP_INTERVAL_SECONDS = float(os.getenv("SWEEP_INTERVAL_SECONDS", "60"))
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "500"))
+
+bookings = Booking.__table__
+airlines = Airline.__table__
+
+_restored = airlines.c.available_seats + bindparam("b_released")
+return_released_seats = (
+    update(airlines)
+    .where(airlines.c.airline_id == bindparam("b_airline_id"))
+    .values(available_seats=case((_restored > airlines.c.capacity, airlines.c.capacity), else_=_restored))
+)
+
+def expire_pending_bookings(hold_minutes=None, batch_size=None, now=None):
+    """Expire PENDING bookings older than the hold window and give their seats back.
+
+    Each batch is three statements in one transaction: pick the oldest
+    expired holds through ix_bookings_status_created_at (skipping rows a
+    payment is holding), flip them to EXPIRED with their seat numbers
+    cleared, and return the seats with one executemany UPDATE per batch.
+    Returns the counts plus the released seats per flight (with its route)
+    so the caller can update its caches. created_at is stamped by the
+    database's NOW(), so the cutoff uses the same local clock.
+    """
+    hold = timedelta(minutes=hold_minutes if hold_minutes is not None else BOOKING_HOLD_MINUTES)
+    batch_size = batch_size or SWEEP_BATCH_SIZE
+    cutoff = (now or datetime.now()) - hold
+    started = time.perf_counter()
+    stats = {"expired": 0, "batches": 0, "flights": 0}
+    released = defaultdict(list)
+    db = SessionLocal()
+    try:
+        while True:
+            rows = db.execute(
+                select(bookings.c.booking_id, bookings.c.airline_id, bookings.c.seat_number)
+                .where(bookings.c.status == "PENDING", bookings.c.created_at < cutoff)
+                .order_by(bookings.c.created_at)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not rows:
+                break
+            db.execute(
+                update(bookings)
+                .where(bookings.c.booking_id.in_([r.booking_id for r in rows]), bookings.c.status == "PENDING")
+                .values(status="EXPIRED", seat_number=None)
+            )
+            per_flight = defaultdict(int)
+            for r in rows:
+                per_flight[r.airline_id] += 1
+                seats = released[r.airline_id]
+                if r.seat_number:
+                    seats.append(r.seat_number)
+            db.execute(return_released_seats,
+                       [{"b_airline_id": a, "b_released": n} for a, n in per_flight.items()])
+            db.commit()
+            stats["expired"] += len(rows)
+            stats["batches"] += 1
+            if len(rows) < batch_size:
+                break
+        routes = {}
+        if released:
+            routes = {r.airline_id: r for r in db.execute(
+                select(airlines.c.airline_id, airlines.c.origin_city, airlines.c.destination_city)
+                .where(airlines.c.airline_id.in_(list(released)))
+            )}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    stats["flights"] = len(released)
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    if stats["expired"]:
+        logger.info("Booking sweep: %(expired)d PENDING bookings expired on %(flights)d flights "
+                    "in %(batches)d batches (%(seconds)ss)", stats)
+    stats["released"] = [
+        {"airline_id": airline_id, "origin_city": routes[airline_id].origin_city,
+         "destination_city": routes[airline_id].destination_city, "seats": seats}
+        for airline_id, seats in released.items() if airline_id in routes
+    ]
+    return stats
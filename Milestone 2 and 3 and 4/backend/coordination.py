@@ -0,0 +1,252 @@
+# coordination.py
+import asyncio
+import json
+import logging
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# "local": one process, it always leads and nobody else needs to hear its invalidations (default)
+# "sqlite": workers on one host share COORDINATION_PATH for leader leases and invalidation messages
+COORDINATION_BACKEND = os.getenv("COORDINATION_BACKEND", "local")
+COORDINATION_PATH = os.getenv("COORDINATION_PATH", "coordination.db")
+COORDINATION_LEASE_SECONDS = float(os.getenv("COORDINATION_LEASE_SECONDS", "15"))
+COORDINATION_POLL_SECONDS = float(os.getenv("COORDINATION_POLL_SECONDS", "1"))
+COORDINATION_MESSAGE_TTL = float(os.getenv("COORDINATION_MESSAGE_TTL", "60"))  # seconds kept for slow pollers
+
+LEADER_LEASE = "scheduler"  # market simulation, fare history pruning and booking expiry
+
+
+class LocalBackend:
+    """In-process backend: every lease is granted and there is nobody to send messages to."""
+
+    name = "local"
+
+    def acquire(self, lease: str, owner: str, ttl: float) -> bool:
+        return True
+
+    def release(self, lease: str, owner: str):
+        pass
+
+    def publish(self, origin: str, channel: str, payload: str):
+        pass
+
+    def receive(self, after: int) -> List[Tuple[int, str, str, str]]:
+        return []
+
+    def last_id(self) -> int:
+        return 0
+
+    def prune(self, before: float):
+        pass
+
+    def shared_secret(self, name: str) -> bytes:
+        return secrets.token_bytes(32)
+
+
+class SQLiteBackend:
+    """Leases and a message log in a SQLite file shared by the workers of one host.
+
+    A lease row is taken over only by its owner or once it has expired, so
+    at most one worker holds it at a time. Messages are appended to a log
+    that every worker reads past its own cursor; the leader trims entries
+    older than COORDINATION_MESSAGE_TTL.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = COORDINATION_PATH):
+        self.path = path
+        self._conn = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():  # never reuse a connection across fork
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases ("
+                         "name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS messages ("
+                         "id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT NOT NULL, channel TEXT NOT NULL, "
+                         "payload TEXT NOT NULL, created_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_messages_created_at ON messages (created_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS secrets (name TEXT PRIMARY KEY, value BLOB NOT NULL)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def acquire(self, lease: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._connection().execute(
+                "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+                (lease, owner, now + ttl, now),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, lease: str, owner: str):
+        with self._lock:
+            self._connection().execute("DELETE FROM leases WHERE name = ? AND owner = ?", (lease, owner))
+
+    def publish(self, origin: str, channel: str, payload: str):
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO messages (origin, channel, payload, created_at) VALUES (?, ?, ?, ?)",
+                (origin, channel, payload, time.time()),
+            )
+
+    def receive(self, after: int) -> List[Tuple[int, str, str, str]]:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT id, origin, channel, payload FROM messages WHERE id > ? ORDER BY id", (after,)
+            ).fetchall()
+
+    def last_id(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+
+    def prune(self, before: float):
+        with self._lock:
+            self._connection().execute("DELETE FROM messages WHERE created_at < ?", (before,))
+
+    def shared_secret(self, name: str) -> bytes:
+        """A random key created by whichever worker asks first, then read by all of them."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR IGNORE INTO secrets (name, value) VALUES (?, ?)", (name, secrets.token_bytes(32)))
+            return conn.execute("SELECT value FROM secrets WHERE name = ?", (name,)).fetchone()[0]
+
+
+BACKENDS = {"local": LocalBackend, "sqlite": SQLiteBackend}
+
+
+class Coordinator:
+    """Leader election and cache invalidation messages between API workers.
+
+    Whoever holds LEADER_LEASE runs the once-per-deployment background work;
+    `heartbeat()` renews or claims it and applies messages other workers
+    published. Publishing never touches local caches: the caller has
+    already updated its own before broadcasting the change.
+    """
+
+    def __init__(self, backend=None, lease_seconds: float = COORDINATION_LEASE_SECONDS):
+        self.backend = backend or BACKENDS[COORDINATION_BACKEND]()
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self._handlers: Dict[str, Callable] = {}
+        self._cursor = None
+        self._leader = False
+        self._leader_until = 0.0  # our lease can only be trusted until it would have expired
+        self._lock = threading.Lock()
+        self.published = self.received = self.publish_errors = self.handler_errors = self.leader_changes = 0
+
+    def subscribe(self, channel: str, handler: Callable):
+        """Call handler(**payload) for every message on `channel` from another worker."""
+        self._handlers[channel] = handler
+
+    def publish(self, channel: str, **payload):
+        """Broadcast a change; failures are logged, the change itself is already committed.
+
+        Called on the event loop (async handlers, schedulers), the backend
+        write is handed to the default executor instead of blocking the loop.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None:
+            loop.run_in_executor(None, self._publish, channel, json.dumps(payload))
+        else:
+            self._publish(channel, json.dumps(payload))
+
+    def _publish(self, channel: str, message: str):
+        try:
+            self.backend.publish(self.worker_id, channel, message)
+        except Exception:
+            logger.exception("Publishing %s message failed", channel)
+            with self._lock:
+                self.publish_errors += 1
+            return
+        with self._lock:
+            self.published += 1
+
+    def lead(self) -> bool:
+        """Claim or renew LEADER_LEASE; True while this worker is the leader."""
+        renewed_at = time.monotonic()
+        try:
+            leader = self.backend.acquire(LEADER_LEASE, self.worker_id, self.lease_seconds)
+        except Exception:
+            logger.exception("Leader lease renewal failed")
+            leader = False
+        with self._lock:
+            if leader != self._leader:
+                self.leader_changes += 1
+                logger.info("Worker %s %s leadership", self.worker_id, "took" if leader else "lost")
+            self._leader = leader
+            self._leader_until = renewed_at + self.lease_seconds if leader else 0.0
+        return leader
+
+    @property
+    def is_leader(self) -> bool:
+        return self._leader and time.monotonic() < self._leader_until
+
+    def poll(self) -> int:
+        """Apply messages published by other workers since the last poll; returns how many."""
+        if self._cursor is None:
+            self._cursor = self.backend.last_id()  # a new worker starts with empty caches
+            return 0
+        applied = 0
+        for message_id, origin, channel, payload in self.backend.receive(self._cursor):
+            self._cursor = message_id
+            handler = self._handlers.get(channel)
+            if origin == self.worker_id or handler is None:
+                continue
+            try:
+                handler(**json.loads(payload))
+                applied += 1
+            except Exception:
+                logger.exception("Handling %s message failed", channel)
+                with self._lock:
+                    self.handler_errors += 1
+        with self._lock:
+            self.received += applied
+        return applied
+
+    def heartbeat(self):
+        if self.lead():
+            self.backend.prune(time.time() - COORDINATION_MESSAGE_TTL)
+        self.poll()
+
+    def resign(self):
+        if self._leader:
+            try:
+                self.backend.release(LEADER_LEASE, self.worker_id)
+            except Exception:
+                logger.exception("Releasing leader lease failed")
+            self._leader = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.backend.name,
+                "worker_id": self.worker_id,
+                "leader": self.is_leader,
+                "lease_seconds": self.lease_seconds,
+                "leader_changes": self.leader_changes,
+                "published": self.published,
+                "received": self.received,
+                "publish_errors": self.publish_errors,
+                "handler_errors": self.handler_errors,
+            }
+
+
+coordinator = Coordinator()
@@ -0,0 +1,236 @@
+# fare_store.py
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, func, insert, select
+
+from db_config import SessionLocal
+from models import FareHistory, FareRollup
+
+logger = logging.getLogger(__name__)
+
+FARE_BUFFER_MAX = int(os.getenv("FARE_BUFFER_MAX", "100000"))  # oldest ticks are dropped beyond this
+FARE_FLUSH_SECONDS = float(os.getenv("FARE_FLUSH_SECONDS", "5"))
+FARE_PRUNE_SECONDS = float(os.getenv("FARE_PRUNE_SECONDS", "3600"))
+FARE_RAW_RETENTION_HOURS = float(os.getenv("FARE_RAW_RETENTION_HOURS", "48"))
+FARE_MINUTE_RETENTION_DAYS = float(os.getenv("FARE_MINUTE_RETENTION_DAYS", "7"))
+FARE_PRUNE_STEP = timedelta(minutes=int(os.getenv("FARE_PRUNE_STEP_MINUTES", "10")))  # time slice per DELETE
+FARE_MAX_POINTS = 5000
+
+# Bucket floor per resolution; hour and day rollups are kept forever
+RESOLUTIONS = {
+    "minute": lambda t: t.replace(second=0, microsecond=0),
+    "hour": lambda t: t.replace(minute=0, second=0, microsecond=0),
+    "day": lambda t: t.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+fare_history = FareHistory.__table__
+fare_rollups = FareRollup.__table__
+
+def rollup_rows(ticks):
+    """Fold fare ticks (flight_id, new_price, changed_at) into one OHLC row per flight and bucket."""
+    buckets = {}
+    for tick in sorted(ticks, key=lambda t: t["changed_at"]):
+        price = round(float(tick["new_price"]), 2)
+        for resolution, floor in RESOLUTIONS.items():
+            key = (tick["flight_id"], resolution, floor(tick["changed_at"]))
+            row = buckets.get(key)
+            if row is None:
+                buckets[key] = {
+                    "flight_id": key[0], "resolution": resolution, "bucket_start": key[2],
+                    "open_price": price, "high_price": price, "low_price": price, "close_price": price,
+                    "ticks": 1, "last_tick_at": tick["changed_at"],
+                }
+            else:
+                row["high_price"] = max(row["high_price"], price)
+                row["low_price"] = min(row["low_price"], price)
+                row["close_price"] = price
+                row["ticks"] += 1
+                row["last_tick_at"] = tick["changed_at"]
+    return list(buckets.values())
+
+def upsert_rollups(db, rows):
+    """Merge OHLC rows into fare_rollups with one executemany upsert.
+
+    close_price only moves to a row whose last tick is at least as late as
+    the stored one, so a batch flushed late (e.g. retried after an outage
+    by another worker) cannot overwrite a newer close.
+    """
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(fare_rollups)
+        newer = stmt.inserted.last_tick_at >= fare_rollups.c.last_tick_at
+        stmt = stmt.on_duplicate_key_update(
+            high_price=func.greatest(fare_rollups.c.high_price, stmt.inserted.high_price),
+            low_price=func.least(fare_rollups.c.low_price, stmt.inserted.low_price),
+            close_price=case((newer, stmt.inserted.close_price), else_=fare_rollups.c.close_price),
+            ticks=fare_rollups.c.ticks + stmt.inserted.ticks,
+            # Same outcome whether MySQL assigns this before or after close_price
+            last_tick_at=func.greatest(fare_rollups.c.last_tick_at, stmt.inserted.last_tick_at),
+        )
+    elif dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as upsert_insert
+            greatest, least = func.max, func.min  # two-argument scalar forms in SQLite
+        else:
+            from sqlalchemy.dialects.postgresql import insert as upsert_insert
+            greatest, least = func.greatest, func.least
+        stmt = upsert_insert(fare_rollups)
+        newer = stmt.excluded.last_tick_at >= fare_rollups.c.last_tick_at
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["flight_id", "resolution", "bucket_start"],
+            set_={
+                "high_price": greatest(fare_rollups.c.high_price, stmt.excluded.high_price),
+                "low_price": least(fare_rollups.c.low_price, stmt.excluded.low_price),
+                "close_price": case((newer, stmt.excluded.close_price), else_=fare_rollups.c.close_price),
+                "ticks": fare_rollups.c.ticks + stmt.excluded.ticks,
+                "last_tick_at": greatest(fare_rollups.c.last_tick_at, stmt.excluded.last_tick_at),
+            },
+        )
+    else:
+        for row in rows:
+            existing = db.get(FareRollup, (row["flight_id"], row["resolution"], row["bucket_start"]))
+            if existing is None:
+                db.add(FareRollup(**row))
+            else:
+                existing.high_price = max(float(existing.high_price), row["high_price"])
+                existing.low_price = min(float(existing.low_price), row["low_price"])
+                if row["last_tick_at"] >= existing.last_tick_at:
+                    existing.close_price = row["close_price"]
+                    existing.last_tick_at = row["last_tick_at"]
+                existing.ticks += row["ticks"]
+        db.flush()
+        return
+    db.execute(stmt, rows)
+
+def write_fare_ticks(db, ticks):
+    """Insert raw fare ticks and fold them into the rollups, in the caller's transaction."""
+    if not ticks:
+        return
+    db.execute(insert(fare_history), ticks)
+    upsert_rollups(db, rollup_rows(ticks))
+
+
+class FareTickBuffer:
+    """Collects single repricings (e.g. /dynamic_price) and writes them in batches.
+
+    record() never touches the database; the fare store scheduler flushes
+    every FARE_FLUSH_SECONDS. At most `max_ticks` are held, so while the
+    database is unreachable the oldest ticks are dropped (and counted)
+    instead of the buffer growing without bound.
+    """
+
+    def __init__(self, max_ticks: int = FARE_BUFFER_MAX):
+        self.max_ticks = max_ticks
+        self._ticks = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # keeps flushed batches in time order
+        self.flushed = self.dropped = self.failures = 0
+
+    def record(self, flight_id, old_price, new_price, changed_at=None):
+        tick = {"flight_id": flight_id, "old_price": old_price, "new_price": new_price,
+                "changed_at": changed_at or datetime.utcnow()}
+        with self._lock:
+            self._ticks.append(tick)
+            self._trim()
+
+    def _trim(self):
+        excess = len(self._ticks) - self.max_ticks
+        if excess > 0:
+            del self._ticks[:excess]
+            self.dropped += excess
+
+    def pending(self):
+        with self._lock:
+            return len(self._ticks)
+
+    def flush(self):
+        """Write every buffered tick in one transaction; returns how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                ticks, self._ticks = self._ticks, []
+            if not ticks:
+                return 0
+            db = SessionLocal()
+            try:
+                write_fare_ticks(db, ticks)
+                db.commit()
+            except Exception:
+                db.rollback()
+                with self._lock:
+                    self._ticks[:0] = ticks  # retry with the next flush
+                    self._trim()
+                    self.failures += 1
+                raise
+            finally:
+                db.close()
+            with self._lock:
+                self.flushed += len(ticks)
+            return len(ticks)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": len(self._ticks),
+                "max_ticks": self.max_ticks,
+                "flushed": self.flushed,
+                "dropped": self.dropped,
+                "flush_failures": self.failures,
+            }
+
+
+fare_buffer = FareTickBuffer()
+
+def _delete_before(db, table, time_column, cutoff, *criteria):
+    """Delete rows older than `cutoff` in FARE_PRUNE_STEP time slices, committing each slice."""
+    oldest = db.execute(select(func.min(time_column)).where(time_column < cutoff, *criteria)).scalar()
+    deleted = 0
+    while oldest is not None and oldest < cutoff:
+        upper = min(cutoff, oldest + FARE_PRUNE_STEP)
+        deleted += db.execute(delete(table).where(time_column < upper, *criteria)).rowcount
+        db.commit()
+        oldest = upper
+    return deleted
+
+def prune_fare_history(now=None, raw_hours=None, minute_days=None):
+    """Drop raw ticks and minute rollups past their retention horizon; hour/day rollups stay."""
+    now = now or datetime.utcnow()
+    raw_cutoff = now - timedelta(hours=raw_hours if raw_hours is not None else FARE_RAW_RETENTION_HOURS)
+    minute_cutoff = now - timedelta(days=minute_days if minute_days is not None else FARE_MINUTE_RETENTION_DAYS)
+    db = SessionLocal()
+    try:
+        stats = {
+            "raw_deleted": _delete_before(db, fare_history, fare_history.c.changed_at, raw_cutoff),
+            "minute_rollups_deleted": _delete_before(db, fare_rollups, fare_rollups.c.bucket_start, minute_cutoff,
+                                                     fare_rollups.c.resolution == "minute"),
+        }
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    logger.info("Fare history pruned: %(raw_deleted)d raw ticks, %(minute_rollups_deleted)d minute rollups", stats)
+    return stats
+
+def fare_series(db, flight_id, resolution, start, end, limit=FARE_MAX_POINTS):
+    """OHLC points for one flight from the rollups, buckets overlapping [start, end)."""
+    rows = db.execute(
+        select(fare_rollups.c.bucket_start, fare_rollups.c.open_price, fare_rollups.c.high_price,
+               fare_rollups.c.low_price, fare_rollups.c.close_price, fare_rollups.c.ticks)
+        .where(fare_rollups.c.flight_id == flight_id,
+               fare_rollups.c.resolution == resolution,
+               fare_rollups.c.bucket_start >= RESOLUTIONS[resolution](start),
+               fare_rollups.c.bucket_start < end)
+        .order_by(fare_rollups.c.bucket_start)
+        .limit(limit)
+    ).all()
+    return [
+        {"t": r.bucket_start.isoformat(), "open": float(r.open_price), "high": float(r.high_price),
+         "low": float(r.low_price), "close": float(r.close_price), "ticks": r.ticks}
+        for r in rows
+    ]
\ No newline at end of file
@@ -0,0 +1,345 @@
+# flight_snapshot.py
+import calendar
+import copy
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import select
+
+from coordination import COORDINATION_BACKEND
+from models import Airline
+from pagination import _json_default
+from search_cache import SEARCH_CACHE_TTL
+
+FLIGHT_SNAPSHOT = os.getenv("FLIGHT_SNAPSHOT", "1") == "1"  # 0 serves the read endpoints from the ORM again
+# Catches flights changed outside the API. Without a shared coordination backend other workers'
+# bookings are only seen by a rebuild, so it is capped at the old search cache TTL
+SNAPSHOT_REBUILD_SECONDS = float(os.getenv("SNAPSHOT_REBUILD_SECONDS", "900"))
+if COORDINATION_BACKEND == "local":
+    SNAPSHOT_REBUILD_SECONDS = min(SNAPSHOT_REBUILD_SECONDS, SEARCH_CACHE_TTL)
+SNAPSHOT_LOAD_CHUNK = 5000
+
+NO_TIME = np.iinfo(np.int64).min  # reads back as NaT through datetime64[s]
+
+airlines = Airline.__table__
+
+_compact = json.JSONEncoder(separators=(",", ":"), default=_json_default).encode  # as FastAPI renders JSON
+
+
+def _epoch(value: Optional[datetime]) -> int:
+    return calendar.timegm(value.timetuple()) if value else NO_TIME
+
+def _text(value: Optional[datetime]) -> Optional[str]:
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
+
+@lru_cache(maxsize=4096)
+def utc_text(epoch: int) -> str:
+    return datetime.utcfromtimestamp(epoch).strftime("%Y-%m-%d %H:%M:%S")
+
+def _number(value):
+    return float(value) if value is not None else np.nan
+
+
+class FlightColumns:
+    """Column arrays for every flight in airline_id order, plus pre-serialized JSON per row.
+
+    Fares, seats and capacity are float arrays with NaN for NULL, times are
+    epoch seconds with NO_TIME for NULL. `routes` maps (origin, destination)
+    to row positions sorted by departure. `versions` holds the snapshot
+    version (epoch milliseconds) at which each row last changed.
+    """
+
+    def __init__(self, rows):
+        n = len(rows)
+        self.airline_ids = np.fromiter((r.airline_id for r in rows), dtype=np.int64, count=n)
+        self.codes = [r.airline_code for r in rows]
+        self.code_index: Dict[str, int] = {code: i for i, code in enumerate(self.codes)}
+        self.id_index: Dict[int, int] = {r.airline_id: i for i, r in enumerate(rows)}
+        self.fares = np.fromiter((_number(r.ticket_price) for r in rows), dtype=float, count=n)
+        self.seats = np.fromiter((_number(r.available_seats) for r in rows), dtype=float, count=n)
+        self.capacity = np.fromiter((_number(r.capacity) for r in rows), dtype=float, count=n)
+        self.departures = np.fromiter((_epoch(r.departure_time) for r in rows), dtype=np.int64, count=n)
+        self.arrivals = np.fromiter((_epoch(r.arrival_time) for r in rows), dtype=np.int64, count=n)
+        self.versions = np.zeros(n, dtype=np.int64)
+        self.shape = [(r.origin_city, r.destination_city, r.departure_time, r.arrival_time) for r in rows]
+        members: Dict[tuple, List[int]] = {}
+        for i, r in enumerate(rows):
+            members.setdefault((r.origin_city, r.destination_city), []).append(i)
+        self.routes = {}
+        for route, positions in members.items():
+            positions = np.array(positions, dtype=np.int64)
+            self.routes[route] = positions[np.argsort(self.departures[positions], kind="stable")]
+        self.flight_json: List[bytes] = [b""] * n
+        self.search_head: List[str] = [""] * n
+        self.provider_json: List[str] = [""] * n
+        for i, r in enumerate(rows):
+            self.serialize(i, r)
+
+    def serialize(self, i: int, r):
+        """Rebuild row i's JSON fragments from a full airlines row."""
+        self.flight_json[i] = _compact({c.key: getattr(r, c.key) for c in airlines.c}).encode()
+        base = float(r.ticket_price) if r.ticket_price is not None else 0.0
+        head = _compact({
+            "airline_code": r.airline_code,
+            "operator_name": r.operator_name,
+            "origin_city": r.origin_city,
+            "destination_city": r.destination_city,
+            "departure_time": _text(r.departure_time),
+            "arrival_time": _text(r.arrival_time),
+            "available_seats": r.available_seats,
+            "ticket_price": base,
+        })
+        self.search_head[i] = head[:-1] + ","
+        self.provider_json[i] = _compact({
+            "origin": r.origin_city,
+            "destination": r.destination_city,
+            "departure_time": _text(r.departure_time),
+            "arrival_time": _text(r.arrival_time),
+            "base_fare": float(r.ticket_price) if r.ticket_price is not None else None,
+            "seats_left": r.available_seats,
+        })[1:-1]
+
+    def patched(self, positions: List[int], rows, version: int) -> "FlightColumns":
+        """A copy with rows at `positions` replaced; readers holding this one never see a half-applied change.
+
+        Route, times and codes are unchanged by a patch, so their arrays and indexes are shared.
+        """
+        columns = copy.copy(self)
+        columns.fares, columns.seats, columns.capacity = self.fares.copy(), self.seats.copy(), self.capacity.copy()
+        columns.versions = self.versions.copy()
+        columns.flight_json, columns.search_head = self.flight_json.copy(), self.search_head.copy()
+        columns.provider_json = self.provider_json.copy()
+        for i, r in zip(positions, rows):
+            columns.fares[i] = _number(r.ticket_price)
+            columns.seats[i] = _number(r.available_seats)
+            columns.capacity[i] = _number(r.capacity)
+            columns.serialize(i, r)
+            columns.versions[i] = version
+        return columns
+
+    # /flights: the column dicts FastAPI would build from ORM objects, keyset-paged on airline_id
+    def flights_page(self, after: Optional[int], limit: int):
+        start = int(np.searchsorted(self.airline_ids, after, side="right")) if after is not None else 0
+        stop = min(start + limit, len(self.codes))
+        body = b"[" + b",".join(self.flight_json[start:stop]) + b"]"
+        next_cursor = int(self.airline_ids[stop - 1]) if stop < len(self.codes) else None
+        return body, next_cursor
+
+    def flights_ndjson(self, after: Optional[int], batch_size: int = SNAPSHOT_LOAD_CHUNK):
+        start = int(np.searchsorted(self.airline_ids, after, side="right")) if after is not None else 0
+        for offset in range(start, len(self.codes), batch_size):
+            yield b"\n".join(self.flight_json[offset:offset + batch_size]) + b"\n"
+
+    # /search
+    def route(self, origin_city: str, destination_city: str, day=None, sort_by: Optional[str] = None) -> np.ndarray:
+        positions = self.routes.get((origin_city, destination_city))
+        if positions is None:
+            return np.empty(0, dtype=np.int64)
+        if day:
+            start = calendar.timegm(day.timetuple())
+            departures = self.departures[positions]
+            positions = positions[np.searchsorted(departures, start):np.searchsorted(departures, start + 86400)]
+        if sort_by == "duration":
+            durations = self.durations(positions)
+            positions = positions[np.argsort(durations, kind="stable")]
+        return positions
+
+    def durations(self, positions: np.ndarray) -> np.ndarray:
+        departures, arrivals = self.departures[positions], self.arrivals[positions]
+        known = (departures != NO_TIME) & (arrivals != NO_TIME)
+        return np.where(known, (arrivals - departures) // 60, 0)
+
+    def pricing(self, positions: np.ndarray):
+        """Flight ids and calculate_dynamic_prices inputs, with the /search defaults for NULLs."""
+        capacity = self.capacity[positions]
+        return self.airline_ids[positions].tolist(), (
+            np.nan_to_num(self.fares[positions], nan=0.0),
+            np.nan_to_num(self.seats[positions], nan=0.0),
+            np.where(np.isnan(capacity) | (capacity == 0), 1.0, capacity),
+            self.departures[positions].astype("datetime64[s]"),
+        )
+
+    def search_json(self, positions: np.ndarray, quotes) -> bytes:
+        durations = self.durations(positions).tolist()
+        return ("[" + ",".join(
+            f'{self.search_head[i]}"dynamic_price":{quote.price!r},"duration_minutes":{duration},'
+            f'"quote":"{quote.token}","quote_expires_at":"{utc_text(quote.expires_at)}"}}'
+            for i, quote, duration in zip(positions.tolist(), quotes, durations)
+        ) + "]").encode()
+
+    # /dynamic_price
+    def fare_inputs(self, i: int):
+        """(airline_id, base fare, seats, capacity, departure) as calculate_dynamic_price takes them."""
+        seats, capacity = self.seats[i], self.capacity[i]
+        departure = int(self.departures[i])
+        return (
+            int(self.airline_ids[i]),
+            0.0 if np.isnan(self.fares[i]) else float(self.fares[i]),
+            None if np.isnan(seats) else int(seats),
+            None if np.isnan(capacity) else int(capacity),
+            None if departure == NO_TIME else datetime.utcfromtimestamp(departure),
+        )
+
+    # /external_api
+    def provider_body(self, provider: str, airline_code: str) -> Optional[bytes]:
+        i = self.code_index.get(airline_code)
+        if i is None:
+            return None
+        head = _compact({"provider": provider, "airline_code": airline_code})[:-1]
+        return f"{head},{self.provider_json[i]}}}".encode()
+
+
+class FlightSnapshot:
+    """Read-only view of `airlines` that the hot read endpoints serve from without ORM objects.
+
+    Writers report changed flight ids (bookings, cancellations, market
+    ticks, other workers' invalidations); the next read reloads just those
+    rows with one query and swaps in a patched copy, so a reader's columns
+    never change under it. A change to a flight's route, times or code, or
+    an unknown id, rebuilds the whole snapshot.
+    """
+
+    def __init__(self, enabled: bool = FLIGHT_SNAPSHOT, rebuild_seconds: float = SNAPSHOT_REBUILD_SECONDS):
+        self.enabled = enabled
+        self.rebuild_seconds = rebuild_seconds
+        self._columns: Optional[FlightColumns] = None
+        self._stale = set()
+        self._full_reload = True
+        self._building = False  # one request rebuilds; the others keep serving the current columns
+        self._built_at = 0.0
+        self.version = 0  # epoch milliseconds of the latest change, strictly increasing
+        self.removed: Dict[str, int] = {}  # airline_code -> version it disappeared at
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # held by the builder, so readers with nothing to serve can wait
+        self.rebuilds = self.partial_refreshes = self.rows_refreshed = 0
+
+    def mark_changed(self, *airline_ids):
+        with self._lock:
+            self._stale.update(airline_ids)
+
+    def mark_all_changed(self):
+        with self._lock:
+            self._full_reload = True
+
+    def ensure_fresh(self, db) -> FlightColumns:
+        """The current columns, after applying pending changes.
+
+        A due rebuild is done by the first request to see it; requests
+        arriving meanwhile keep serving the previous columns (and leave
+        newer changes marked, to be applied on top of the rebuilt ones).
+        """
+        with self._lock:
+            due = (self._full_reload or self._columns is None
+                   or time.monotonic() - self._built_at >= self.rebuild_seconds)
+            build = due and not self._building
+            stale = set()
+            if build:
+                self._building, self._full_reload = True, False
+                self._stale = set()  # the rebuild reads every row after this
+            elif not self._building:
+                stale, self._stale = self._stale, set()
+            columns = self._columns
+        if build:
+            with self._build_lock:
+                try:
+                    self._rebuild(db)
+                except Exception:
+                    self.mark_all_changed()  # retried by the next read
+                    raise
+                finally:
+                    with self._lock:
+                        self._building = False
+            return self._columns
+        if columns is None:  # the first build is running in another request
+            with self._build_lock:
+                pass
+            return self.ensure_fresh(db)
+        if stale:
+            try:
+                refreshed = self._refresh(db, sorted(stale))
+            except Exception:
+                self.mark_changed(*stale)  # retried by the next read
+                raise
+            if not refreshed:
+                self.mark_all_changed()
+                return self.ensure_fresh(db)
+        return self._columns
+
+    def _refresh(self, db, airline_ids) -> bool:
+        """Swap in a copy with the changed rows reloaded; False when only a rebuild can apply them."""
+        rows = []
+        for start in range(0, len(airline_ids), SNAPSHOT_LOAD_CHUNK):
+            chunk = airline_ids[start:start + SNAPSHOT_LOAD_CHUNK]
+            rows.extend(db.execute(select(airlines).where(airlines.c.airline_id.in_(chunk))).all())
+        if len(rows) != len(airline_ids):
+            return False  # a flight was deleted or one we never saw
+        with self._lock:  # patch whatever is current, so concurrent refreshes don't drop each other's rows
+            columns = self._columns
+            positions = [columns.id_index.get(r.airline_id) for r in rows]
+            if any(i is None or columns.shape[i] != (r.origin_city, r.destination_city, r.departure_time,
+                                                     r.arrival_time) or columns.codes[i] != r.airline_code
+                   for i, r in zip(positions, rows)):
+                return False
+            self._columns = columns.patched(positions, rows, self._next_version())
+            self.partial_refreshes += 1
+            self.rows_refreshed += len(rows)
+        return True
+
+    def _rebuild(self, db):
+        rows, last_id = [], 0
+        while True:
+            chunk = db.execute(
+                select(airlines).where(airlines.c.airline_id > last_id)
+                .order_by(airlines.c.airline_id).limit(SNAPSHOT_LOAD_CHUNK)
+            ).all()
+            if not chunk:
+                break
+            rows.extend(chunk)
+            last_id = chunk[-1].airline_id
+        columns = FlightColumns(rows)
+        with self._lock:
+            version = self._next_version()
+            previous = self._columns
+            if previous is None:
+                columns.versions[:] = version
+            else:
+                # Rows that came back unchanged keep their version, so deltas stay small
+                for i, airline_id in enumerate(columns.airline_ids.tolist()):
+                    j = previous.id_index.get(airline_id)
+                    unchanged = j is not None and previous.flight_json[j] == columns.flight_json[i]
+                    columns.versions[i] = previous.versions[j] if unchanged else version
+                for code in set(previous.codes) - set(columns.codes):
+                    self.removed[code] = version
+            self._columns = columns
+            self._built_at = time.monotonic()
+            self.rebuilds += 1
+
+    def _next_version(self) -> int:
+        self.version = max(self.version + 1, time.time_ns() // 1_000_000)
+        return self.version
+
+    def stats(self):
+        with self._lock:
+            columns = self._columns
+            return {
+                "enabled": self.enabled,
+                "rebuild_seconds": self.rebuild_seconds,
+                "version": self.version,
+                "flights": len(columns.codes) if columns is not None else 0,
+                "routes": len(columns.routes) if columns is not None else 0,
+                "pending_changes": len(self._stale),
+                "full_reload_pending": self._full_reload,
+                "building": self._building,
+                "rebuilds": self.rebuilds,
+                "partial_refreshes": self.partial_refreshes,
+                "rows_refreshed": self.rows_refreshed,
+            }
+
+
+flight_snapshot = FlightSnapshot()
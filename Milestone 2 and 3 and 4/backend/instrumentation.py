@@ -0,0 +1,292 @@
+# instrumentation.py
+import asyncio
+import contextvars
+import functools
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # profile 1 in N requests, 0 = off
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+class RequestStats:
+    __slots__ = ("sql_count", "sql_seconds", "sections")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.sections = defaultdict(float)
+
+
+# Stats of the request being served; Starlette copies the context into the
+# threadpool, so sync endpoints add to the same object
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Counters and histograms for this worker process, rendered in the Prometheus text format."""
+
+    HELP = {
+        "http_requests_total": ("counter", "Requests served, by route template and status"),
+        "http_request_duration_seconds": ("histogram", "Request latency including the response body"),
+        "http_request_db_queries": ("histogram", "SQL statements executed per request"),
+        "http_request_db_seconds": ("histogram", "Time spent in SQL per request"),
+        "db_queries_total": ("counter", "SQL statements executed, including background work"),
+        "db_query_seconds_total": ("counter", "Time spent in SQL, including background work"),
+        "hot_path_seconds": ("histogram", "Time spent in instrumented hot paths (pricing, PDF rendering)"),
+        "profiles_written_total": ("counter", "Sampled request profiles written to PROFILE_DIR"),
+        "bookings_expired_total": ("counter", "PENDING bookings expired by the sweeper, seats returned"),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> Histogram
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            self._counters[(name, labels)] += value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            histogram = self._histograms.get((name, labels))
+            if histogram is None:
+                histogram = self._histograms[(name, labels)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            histograms = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in histograms]
+
+        lines, described = [], set()
+
+        def describe(name):
+            if name not in described:
+                described.add(name)
+                kind, text = self.HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            describe(name)
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), counts, total, count, buckets in histograms:
+            describe(name)
+            cumulative = 0
+            for bound, n in zip(buckets, counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+metrics = Metrics()
+
+
+class section_timer:
+    """Time a block as `section` in hot_path_seconds and in the current request's Server-Timing."""
+
+    __slots__ = ("section", "started")
+
+    def __init__(self, section):
+        self.section = section
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        metrics.observe("hot_path_seconds", (("section", self.section),), elapsed)
+        stats = current_request.get()
+        if stats is not None:
+            stats.sections[self.section] += elapsed
+        return False
+
+
+def timed(section):
+    """Decorator form of section_timer; a no-op when METRICS_ENABLED=0."""
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with section_timer(section):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def instrument_engine(engine):
+    """Count statements and SQL time on `engine` (a sync Engine, or an AsyncEngine's sync_engine)."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        metrics.inc("db_queries_total")
+        metrics.inc("db_query_seconds_total", value=elapsed)
+        stats = current_request.get()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_seconds += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        if context.connection is not None:
+            context.connection.info.pop("query_started", None)
+
+
+class StackSampler(threading.Thread):
+    """Samples the stacks running `code` every PROFILE_INTERVAL_MS into folded-stack counts.
+
+    Sync endpoints run on an arbitrary threadpool thread, so samples are
+    taken from whichever threads are inside the endpoint function; a
+    concurrent request to the same route can show up in the same profile.
+    """
+
+    def __init__(self, code, interval=PROFILE_INTERVAL_MS / 1000):
+        super().__init__(daemon=True)
+        self.code = code
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            code = self.code()
+            if code is None:
+                continue
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                if code in stack:
+                    self.stacks[";".join(_frame_label(c) for c in reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def write_profile(stacks, method, route):
+    """Write folded stacks (flamegraph.pl / speedscope / inferno input) and return the path."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = re.sub(r"[^A-Za-z0-9]+", "_", f"{method} {route}").strip("_")
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{name}.folded")
+    with open(path, "w") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    return path
+
+
+def finish_profile(sampler, method, route):
+    """Stop the sampler and write its profile; joins a thread and writes a file, so run it off the loop."""
+    sampler.stop()
+    if sampler.stacks:
+        write_profile(sampler.stacks, method, route)
+        metrics.inc("profiles_written_total")
+
+
+class InstrumentationMiddleware:
+    """Per-route latency, SQL and hot-path metrics, a Server-Timing header and 1-in-N profiling."""
+
+    def __init__(self, app, sample_rate: int = PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+        self._requests = itertools.count(1)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+        sampler = None
+        if self.sample_rate and next(self._requests) % self.sample_rate == 0:
+            sampler = StackSampler(lambda: getattr(scope.get("endpoint"), "__code__", None))
+            sampler.start()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                timings = [f'db;dur={stats.sql_seconds * 1000:.2f};desc="{stats.sql_count} queries"']
+                timings += [f"{name};dur={seconds * 1000:.2f}" for name, seconds in stats.sections.items()]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"server-timing", ", ".join(timings).encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            labels = (("method", method), ("route", route))
+            metrics.inc("http_requests_total", labels + (("status", str(status_code)),))
+            metrics.observe("http_request_duration_seconds", labels, elapsed)
+            metrics.observe("http_request_db_queries", labels, stats.sql_count, QUERY_COUNT_BUCKETS)
+            metrics.observe("http_request_db_seconds", labels, stats.sql_seconds)
+            if sampler is not None:
+                await asyncio.to_thread(finish_profile, sampler, method, route)
\ No newline at end of file
@@ -0,0 +1,171 @@
+# market_replay.py
+import csv
+import time
+from datetime import datetime, timedelta
+from itertools import repeat
+
+import numpy as np
+
+from market_simulator import MARKET_CHUNK_SIZE, MARKET_INTERVAL_SECONDS, SEAT_CHANGES, market_move, read_flight_chunks
+
+TRAJECTORY_COLUMNS = ("tick", "at", "flight_id", "available_seats", "old_price", "new_price")
+PARQUET_ROW_GROUP = 1_000_000
+
+
+class MarketReplay:
+    """Market ticks replayed offline over an in-memory copy of the airlines table.
+
+    Each tick applies the live simulator's seat moves and pricing
+    (market_move) with a seeded numpy Generator and a virtual clock that
+    advances `tick_seconds`, so the same seed, start and snapshot always
+    give the same trajectories and nothing is written back to the database.
+    Flights stop trading once the clock passes their departure.
+
+    reprice_from="current" prices every tick off the last fare, as the live
+    tick does (fares compound); "base" reprices from the snapshot fare.
+    """
+
+    def __init__(self, airline_ids, fares, capacity, available, departures, seed=0, start=None,
+                 tick_seconds=MARKET_INTERVAL_SECONDS, seat_changes=SEAT_CHANGES, reprice_from="current"):
+        if reprice_from not in ("current", "base"):
+            raise ValueError("reprice_from must be 'current' or 'base'")
+        self.airline_ids = np.asarray(airline_ids, dtype=np.int64)
+        self.base_fares = np.asarray(fares, dtype=float)
+        self.fares = self.base_fares.copy()
+        self.capacity = np.asarray(capacity, dtype=np.int64)
+        self.available = np.asarray(available, dtype=np.int64)
+        self.initial_available = self.available.copy()
+        self.departures = np.asarray(departures, dtype="datetime64[s]")
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.start = start or datetime.now().replace(second=0, microsecond=0)
+        self.clock = self.start
+        self.tick_seconds = tick_seconds
+        self.seat_changes = np.asarray(seat_changes)
+        self.reprice_from = reprice_from
+        self.ticks = self.moves = 0
+
+    @classmethod
+    def from_db(cls, db, chunk_size=None, **kw):
+        """Snapshot every flight's pricing columns (read only), the same columns the live tick reads."""
+        ids, fares, capacity, available, departures = [], [], [], [], []
+        for rows in read_flight_chunks(db, chunk_size or MARKET_CHUNK_SIZE):
+            for airline_id, fare, cap, seats, departure in rows:
+                ids.append(airline_id)
+                fares.append(float(fare or 0.0))
+                capacity.append(cap or 0)
+                available.append(seats or 0)
+                departures.append(departure)
+        return cls(ids, fares, capacity, available, np.array(departures, dtype="datetime64[s]"), **kw)
+
+    def step(self):
+        """Advance the clock one tick; returns (changed positions, old prices, new prices)."""
+        self.clock += timedelta(seconds=self.tick_seconds)
+        now = np.datetime64(self.clock, "s")
+        active = np.flatnonzero(np.isnat(self.departures) | (self.departures > now))
+        fares = self.fares if self.reprice_from == "current" else self.base_fares
+        changed, new_avail, new_prices = market_move(
+            fares[active], self.available[active], self.capacity[active], self.departures[active],
+            self.rng, self.clock, self.seat_changes
+        )
+        self.available[active] = new_avail
+        changed = active[changed]
+        old_prices = self.fares[changed]
+        self.fares[changed] = new_prices
+        self.ticks += 1
+        self.moves += len(changed)
+        return changed, old_prices, new_prices
+
+    def run(self, ticks, trajectory=None):
+        """Replay `ticks` ticks, writing the starting state and then every change to `trajectory`."""
+        started = time.perf_counter()
+        if trajectory is not None and self.ticks == 0:
+            trajectory.write(0, self.clock, self.airline_ids, self.available, self.fares, self.fares)
+        for _ in range(ticks):
+            changed, old_prices, new_prices = self.step()
+            if trajectory is not None and len(changed):
+                trajectory.write(self.ticks, self.clock, self.airline_ids[changed], self.available[changed],
+                                 old_prices, new_prices)
+        elapsed = time.perf_counter() - started
+        stats = self.stats()
+        stats["seconds"] = round(elapsed, 3)
+        stats["ticks_per_second"] = round(ticks / elapsed, 1) if elapsed else None
+        stats["speedup"] = round(ticks * self.tick_seconds / elapsed) if elapsed else None  # vs real time
+        return stats
+
+    def stats(self):
+        sold = self.initial_available - self.available
+        return {
+            "seed": self.seed,
+            "start": self.start.isoformat(sep=" "),
+            "clock": self.clock.isoformat(sep=" "),
+            "tick_seconds": self.tick_seconds,
+            "reprice_from": self.reprice_from,
+            "flights": len(self.airline_ids),
+            "ticks": self.ticks,
+            "moves": self.moves,
+            "seats_sold": int(sold.sum()),
+            "mean_fare": round(float(self.fares.mean()), 2) if len(self.fares) else None,
+        }
+
+
+class CSVTrajectory:
+    """Trajectory rows as CSV, one row per flight that changed on a tick."""
+
+    def __init__(self, path):
+        self._file = open(path, "w", newline="")
+        self._csv = csv.writer(self._file)
+        self._csv.writerow(TRAJECTORY_COLUMNS)
+        self.rows = 0
+
+    def write(self, tick, at, flight_ids, seats, old_prices, new_prices):
+        self._csv.writerows(zip(repeat(tick), repeat(at.isoformat(sep=" ")), flight_ids.tolist(), seats.tolist(),
+                                old_prices.tolist(), new_prices.tolist()))
+        self.rows += len(flight_ids)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetTrajectory:
+    """The same rows as Parquet, buffered into row groups of PARQUET_ROW_GROUP (needs pyarrow)."""
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow); use a .csv path instead")
+        self._pa = pa
+        self._schema = pa.schema([("tick", pa.int32()), ("at", pa.timestamp("s")), ("flight_id", pa.int64()),
+                                  ("available_seats", pa.int32()), ("old_price", pa.float64()),
+                                  ("new_price", pa.float64())])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._buffer = []
+        self._buffered = 0
+        self.rows = 0
+
+    def write(self, tick, at, flight_ids, seats, old_prices, new_prices):
+        n = len(flight_ids)
+        self._buffer.append((np.full(n, tick, dtype=np.int32), np.full(n, np.datetime64(at, "s")),
+                             flight_ids, seats.astype(np.int32), old_prices, new_prices))
+        self._buffered += n
+        self.rows += n
+        if self._buffered >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        columns = [np.concatenate(parts) for parts in zip(*self._buffer)]
+        self._writer.write_table(self._pa.Table.from_arrays(columns, schema=self._schema))
+        self._buffer, self._buffered = [], 0
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+def open_trajectory(path):
+    """A trajectory writer for `path`: Parquet for .parquet, CSV otherwise."""
+    return ParquetTrajectory(path) if path.endswith(".parquet") else CSVTrajectory(path)
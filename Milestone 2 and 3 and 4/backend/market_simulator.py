@@ -0,0 +1,143 @@
+# market_simulator.py
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import bindparam, case, func, select, update
+
+from db_config import SessionLocal
+from models import Airline
+from pricing_engine import calculate_dynamic_prices
+from search_cache import search_cache
+from route_graph import route_graph
+from flight_snapshot import flight_snapshot
+from fare_store import write_fare_ticks
+
+logger = logging.getLogger(__name__)
+
+MARKET_INTERVAL_SECONDS = int(os.getenv("MARKET_INTERVAL_SECONDS", "300"))
+MARKET_CHUNK_SIZE = int(os.getenv("MARKET_CHUNK_SIZE", "5000"))
+MARKET_COMMIT_EVERY = int(os.getenv("MARKET_COMMIT_EVERY", "10"))  # chunks per commit
+MARKET_FEED_MAX_IDS = int(os.getenv("MARKET_FEED_MAX_IDS", "10000"))  # larger ticks make other workers reload everything
+
+SEAT_CHANGES = np.array([-2, -1, 0, 0, 1])
+
+airlines = Airline.__table__
+
+# Seats move by a delta applied to the row as it is now, clamped to [0, capacity]: writing the
+# value read at the start of the tick would undo bookings committed while the tick ran
+_moved_seats = func.coalesce(airlines.c.available_seats, 0) + bindparam("b_seat_delta")
+_capacity = func.coalesce(airlines.c.capacity, 0)
+update_seats = (
+    update(airlines)
+    .where(airlines.c.airline_id == bindparam("b_airline_id"))
+    .values(available_seats=case((_moved_seats < 0, 0), (_moved_seats > _capacity, _capacity), else_=_moved_seats))
+)
+
+def read_flight_chunks(db, chunk_size):
+    """Yield pricing columns of every flight in airline_id order, chunk_size rows at a time."""
+    last_id = 0
+    while True:
+        rows = db.execute(
+            select(airlines.c.airline_id, airlines.c.ticket_price, airlines.c.capacity,
+                   airlines.c.available_seats, airlines.c.departure_time)
+            .where(airlines.c.airline_id > last_id)
+            .order_by(airlines.c.airline_id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+def market_move(fares, available, capacity, departures, rng, now, seat_changes=SEAT_CHANGES):
+    """One tick over parallel arrays: a random seat move per flight, then reprice the flights that moved.
+
+    Returns (positions that changed, new available seats for every flight,
+    new prices for the changed positions). Shared by the live tick and
+    market_replay, so both draw from `rng` in the same order.
+    """
+    new_avail = np.clip(available + rng.choice(seat_changes, size=len(available)), 0, capacity)
+    changed = np.flatnonzero(new_avail != available)
+    if not len(changed):
+        return changed, new_avail, np.empty(0)
+    new_prices = calculate_dynamic_prices(
+        fares[changed],
+        new_avail[changed],
+        capacity[changed],
+        departures[changed],
+        now=now,
+        rng=rng
+    )
+    return changed, new_avail, new_prices
+
+def simulate_chunk(rows, rng, now):
+    """Apply one random seat move per flight; return seat updates and fare history rows."""
+    ids, fares, capacities, seats, departures = zip(*rows)
+    fares = np.array([float(p or 0.0) for p in fares])
+    seats = np.array([s or 0 for s in seats])
+    changed, new_avail, new_prices = market_move(
+        fares,
+        seats,
+        np.array([c or 0 for c in capacities]),
+        np.array(departures, dtype="datetime64[s]"),
+        rng,
+        now
+    )
+    if not len(changed):
+        return [], []
+    changed_ids = np.array(ids)[changed].tolist()
+    old_prices = fares[changed]
+    changed_at = datetime.utcnow()
+    seat_rows = [{"b_airline_id": i, "b_seat_delta": d}
+                 for i, d in zip(changed_ids, (new_avail[changed] - seats[changed]).tolist())]
+    fare_rows = [{"flight_id": i, "old_price": o, "new_price": n, "changed_at": changed_at}
+                 for i, o, n in zip(changed_ids, old_prices.tolist(), new_prices.tolist())]
+    return seat_rows, fare_rows
+
+def simulate_market_step(chunk_size=None, commit_every=None, rng=None, now=None):
+    """Run one market tick over all flights, streaming them in chunks.
+
+    Each chunk is written back with one executemany UPDATE and one
+    batch of fare ticks (raw rows plus rollups); the transaction is committed
+    every `commit_every` chunks so no tick holds the whole fleet at once.
+    """
+    chunk_size = chunk_size or MARKET_CHUNK_SIZE
+    commit_every = commit_every or MARKET_COMMIT_EVERY
+    rng = rng if rng is not None else np.random.default_rng()
+    now = now or datetime.now()
+    started = time.perf_counter()
+    stats = {"flights": 0, "changed": 0, "chunks": 0}
+    changed_ids = []
+    db = SessionLocal()
+    try:
+        for rows in read_flight_chunks(db, chunk_size):
+            seat_rows, fare_rows = simulate_chunk(rows, rng, now)
+            if seat_rows:
+                db.execute(update_seats, seat_rows)
+                write_fare_ticks(db, fare_rows)
+                changed_ids.extend(row["b_airline_id"] for row in seat_rows)
+            stats["flights"] += len(rows)
+            stats["changed"] += len(seat_rows)
+            stats["chunks"] += 1
+            if stats["chunks"] % commit_every == 0:
+                db.commit()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+        if changed_ids:
+            search_cache.clear()
+            route_graph.mark_changed(*changed_ids)
+            flight_snapshot.mark_changed(*changed_ids)
+    elapsed = time.perf_counter() - started
+    stats["seconds"] = round(elapsed, 3)
+    stats["flights_per_second"] = round(stats["flights"] / elapsed, 1) if elapsed else None
+    logger.info("Market tick: %(flights)d flights, %(changed)d changed in %(seconds)ss "
+                "(%(flights_per_second)s flights/s)", stats)
+    stats["airline_ids"] = changed_ids
+    return stats
\ No newline at end of file
@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, DECIMAL, DateTime, ForeignKey, func
+from sqlalchemy import Column, Integer, BigInteger, String, DECIMAL, DateTime, ForeignKey, Index, func
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from db_config import Base
@@ -18,6 +18,10 @@ class Airline(Base):
     operator_name = Column(String(20))
     reservations = relationship("Reservation", back_populates="airline")
     bookings = relationship("Booking", back_populates="airline")
+    __table_args__ = (
+        Index("ix_airlines_route_departure", "origin_city", "destination_city", "departure_time"),
+        Index("ux_airlines_airline_code", "airline_code", unique=True),
+    )
 
 class Reservation(Base):
     __tablename__ = "reservations"
@@ -39,16 +43,42 @@ class FareHistory(Base):
     new_price = Column(DECIMAL(10, 2))
     changed_at = Column(DateTime, default=datetime.utcnow)
 
+class FareRollup(Base):
+    """OHLC of new_price per flight over one minute, hour or day bucket (UTC), kept by fare_store."""
+    __tablename__ = "fare_rollups"
+    flight_id = Column(Integer, primary_key=True)
+    resolution = Column(String(6), primary_key=True)  # minute, hour, day
+    bucket_start = Column(DateTime, primary_key=True)
+    open_price = Column(DECIMAL(10, 2), nullable=False)
+    high_price = Column(DECIMAL(10, 2), nullable=False)
+    low_price = Column(DECIMAL(10, 2), nullable=False)
+    close_price = Column(DECIMAL(10, 2), nullable=False)
+    ticks = Column(Integer, nullable=False)
+    last_tick_at = Column(DateTime, nullable=False)  # changed_at of the tick close_price came from
+    __table_args__ = (
+        Index("ix_fare_rollups_resolution_bucket", "resolution", "bucket_start"),
+    )
+
 class Booking(Base):
     __tablename__ = "bookings"
     booking_id = Column(Integer, primary_key=True, autoincrement=True)
-    pnr = Column(String(20), unique=True, nullable=False)
+    pnr = Column(String(20), nullable=False)
     airline_id = Column(Integer, ForeignKey("airlines.airline_id"), nullable=False)
     passenger_name = Column(String(100), nullable=False)
     contact_number = Column(String(30))
     seat_number = Column(Integer)
     price = Column(DECIMAL(10, 2))
-    status = Column(String(20), nullable=False)  # PENDING, CONFIRMED, PAID, CANCELLED, FAILED
+    status = Column(String(20), nullable=False)  # PENDING, CONFIRMED, PAID, CANCELLED, FAILED, EXPIRED
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
-    airline = relationship("Airline", back_populates="bookings")
\ No newline at end of file
+    airline = relationship("Airline", back_populates="bookings")
+    __table_args__ = (
+        Index("ux_bookings_pnr", "pnr", unique=True),  # named so PNR clashes can be told from seat clashes
+        Index("ux_airline_seat", "airline_id", "seat_number", unique=True),
+        Index("ix_bookings_status_created_at", "status", "created_at"),
+    )
+
+class PnrBlock(Base):
+    __tablename__ = "pnr_blocks"
+    name = Column(String(20), primary_key=True)
+    next_value = Column(BigInteger, nullable=False)
\ No newline at end of file
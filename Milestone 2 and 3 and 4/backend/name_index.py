@@ -0,0 +1,343 @@
+# name_index.py
+import os
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+
+from models import Booking, Reservation
+
+NAME_INDEX = os.getenv("NAME_INDEX", "1") == "1"  # 0 = plain ILIKE scans for passenger_name filters
+NAME_INDEX_DELTA_MAX = int(os.getenv("NAME_INDEX_DELTA_MAX", "50000"))  # postings buffered before a merge
+NAME_INDEX_HOLE_SECONDS = float(os.getenv("NAME_INDEX_HOLE_SECONDS", "600"))  # skipped ids watched for late commits
+NAME_INDEX_HOLE_POLL_SECONDS = float(os.getenv("NAME_INDEX_HOLE_POLL_SECONDS", "1"))
+NAME_INDEX_MAX_HOLES = int(os.getenv("NAME_INDEX_MAX_HOLES", "100000"))
+NAME_INDEX_MAX_CANDIDATES = int(os.getenv("NAME_INDEX_MAX_CANDIDATES", "20000"))  # with other filters, scan instead
+NAME_INDEX_LOAD_CHUNK = 100000
+
+PREFIX_MARK = b"\x02"  # starts every indexed name, so prefixes have grams of their own
+
+
+def fold(name: str) -> str:
+    """Lower case without accents, close to what the ci collations compare."""
+    if name.isascii():
+        return name.lower()
+    decomposed = unicodedata.normalize("NFKD", name)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def _name_grams(ids, names):
+    """Sorted unique (gram << 32 | id) keys for a batch of names.
+
+    A gram is three UTF-8 bytes of PREFIX_MARK + fold(name) packed into an
+    int; the marker plus the first byte is also indexed (as a gram with a
+    zero high byte), which answers one-character prefixes.
+    """
+    encoded = [PREFIX_MARK + fold(name).encode() for name in names]
+    lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+    width = max(3, int(lengths.max()))
+    text = np.frombuffer(b"".join(e.ljust(width, b"\0") for e in encoded), dtype=np.uint8)
+    text = text.reshape(len(encoded), width).astype(np.int64)
+    grams = (text[:, :-2] << 16) | (text[:, 1:-1] << 8) | text[:, 2:]
+    valid = np.arange(width - 2) < (lengths - 2)[:, None]
+    ids = np.asarray(ids, dtype=np.int64)
+    keys = [(grams[valid] << 32) | np.broadcast_to(ids[:, None], grams.shape)[valid]]
+    named = lengths >= 2
+    keys.append((((text[named, 0] << 8) | text[named, 1]) << 32) | ids[named])
+    return np.unique(np.concatenate(keys))
+
+
+def _query_grams(text: str, prefix: bool) -> Optional[np.ndarray]:
+    """Grams every matching name contains, or None if the index cannot narrow the query."""
+    if "%" in text or "_" in text:  # LIKE wildcards: leave those to the database
+        return None
+    encoded = (PREFIX_MARK if prefix else b"") + fold(text).encode()
+    if len(encoded) == 2 and prefix:
+        return np.array([(encoded[0] << 8) | encoded[1]], dtype=np.int64)
+    if len(encoded) < 3:
+        return None
+    raw = np.frombuffer(encoded, dtype=np.uint8).astype(np.int64)
+    return np.unique((raw[:-2] << 16) | (raw[1:-1] << 8) | raw[2:])
+
+
+def _in_sorted(haystack: np.ndarray, needles: np.ndarray) -> np.ndarray:
+    """Mask of needles present in the sorted haystack, by binary search."""
+    if not len(haystack):
+        return np.zeros(len(needles), dtype=bool)
+    positions = np.minimum(np.searchsorted(haystack, needles), len(haystack) - 1)
+    return haystack[positions] == needles
+
+
+class NameIndex:
+    """In-process trigram index over a table's passenger names.
+
+    Postings live in three numpy arrays: sorted gram codes, their offsets
+    and the ids, sorted per gram. New rows go to a small per-gram delta
+    that is merged in once it holds NAME_INDEX_DELTA_MAX postings. A query
+    takes the shortest posting list and keeps the ids found in every other
+    one by binary search, so it costs about the rarest gram's length rather
+    than the table size. Candidates are still checked by the caller's
+    ILIKE on their primary keys, so deleted rows and rare gram collisions
+    never reach a response.
+
+    Rows inserted by this worker are added on commit. Before each query a
+    MAX(id) probe checks for rows past the highest id read from the table,
+    which picks up other workers and bulk loads. Ids skipped by that read
+    (transactions still open, or rolled back) are remembered as holes and
+    re-read by primary key every NAME_INDEX_HOLE_POLL_SECONDS, so a late
+    commit is indexed however far behind the tail it lands. A hole is
+    given up after NAME_INDEX_HOLE_SECONDS, far longer than any booking
+    transaction runs.
+    """
+
+    def __init__(self, key_column, name_column):
+        self.key_column = key_column
+        self.name_column = name_column
+        self._codes = np.empty(0, dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._ids = np.empty(0, dtype=np.uint32)
+        self._delta: Dict[int, List[int]] = {}
+        self._delta_postings = 0
+        self._indexed = np.zeros(0, dtype=bool)  # by id: already in the postings
+        self._removed = set()
+        self._max_id = 0  # highest id read from the table
+        self._holes: Dict[int, float] = {}  # id below _max_id not seen yet -> monotonic time to give up
+        self._holes_checked = 0.0
+        self._built = False
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # one build at a time
+        self.builds = self.merges = self.queries = self.late_rows = self.holes_expired = 0
+        self.build_seconds = 0.0
+
+    def add(self, key: int, name: Optional[str]):
+        self.add_many([(key, name)])
+
+    def add_many(self, rows):
+        indexed = self._indexed
+        rows = [(key, name) for key, name in rows if name and not (key < len(indexed) and indexed[key])]
+        if not rows:
+            return
+        keys = _name_grams([key for key, _ in rows], [name for _, name in rows])
+        with self._lock:
+            if not self._built:
+                return  # the build reads them from the table
+            top = max(key for key, _ in rows)
+            if top >= len(self._indexed):
+                self._indexed = np.concatenate([self._indexed, np.zeros(max(top + 1, 2 * len(self._indexed))
+                                                                        - len(self._indexed), dtype=bool)])
+            ids = keys & 0xFFFFFFFF
+            fresh = ~self._indexed[ids]
+            for gram, key in zip((keys[fresh] >> 32).tolist(), ids[fresh].tolist()):
+                self._delta.setdefault(gram, []).append(key)
+            self._delta_postings += int(fresh.sum())
+            self._indexed[ids] = True
+            if self._delta_postings >= NAME_INDEX_DELTA_MAX:
+                self._merge()
+
+    def discard(self, key: int):
+        """Drop a deleted row from future candidates (its postings go at the next build)."""
+        with self._lock:
+            self._removed.add(key)
+
+    def _merge(self):
+        grams = sorted(self._delta)
+        counts = np.array([len(self._delta[g]) for g in grams], dtype=np.int64)
+        delta_codes = np.repeat(np.array(grams, dtype=np.int64), counts)
+        delta_ids = np.concatenate([np.array(sorted(self._delta[g]), dtype=np.uint32) for g in grams])
+        # Each delta posting goes after the last id of its gram, or where the gram belongs if it is new
+        at = self._offsets[np.searchsorted(self._codes, delta_codes, side="right")]
+        ids = np.insert(self._ids, at, delta_ids)
+        codes = np.union1d(self._codes, grams)
+        sizes = np.zeros(len(codes), dtype=np.int64)
+        sizes[np.searchsorted(codes, self._codes)] = np.diff(self._offsets)
+        sizes[np.searchsorted(codes, grams)] += counts
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        # Rows committed out of id order leave a gram unsorted; re-sort just those
+        known = np.isin(grams, self._codes)
+        if known.any():
+            known_grams = np.asarray(grams)[known]
+            last = self._ids[self._offsets[np.searchsorted(self._codes, known_grams) + 1] - 1]
+            first_new = np.array([min(self._delta[g]) for g in known_grams.tolist()])
+            for gram in known_grams[first_new < last].tolist():
+                i = np.searchsorted(codes, gram)
+                ids[offsets[i]:offsets[i + 1]].sort()
+        self._codes, self._offsets, self._ids = codes, offsets, ids
+        self._delta, self._delta_postings = {}, 0
+        self.merges += 1
+
+    def _postings(self, gram: int) -> np.ndarray:
+        i = np.searchsorted(self._codes, gram)
+        if i < len(self._codes) and self._codes[i] == gram:
+            return self._ids[self._offsets[i]:self._offsets[i + 1]]
+        return self._ids[:0]
+
+    def build(self, db):
+        """Load the whole table (at startup, in the background); a no-op once built."""
+        with self._build_lock:
+            if not self._built:
+                self._rebuild(db)
+
+    def ensure_fresh(self, db) -> bool:
+        """Index rows committed since the last call; False until build() has finished.
+
+        Queries never wait for the build: until then callers filter by ILIKE.
+        """
+        with self._lock:
+            built, max_id = self._built, self._max_id
+        if not built:
+            return False
+        self._check_holes(db)
+        top = db.execute(select(func.max(self.key_column))).scalar() or 0
+        if top <= max_id:
+            return True
+        rows = db.execute(
+            select(self.key_column, self.name_column)
+            .where(self.key_column > max_id, self.key_column <= top).order_by(self.key_column)
+        ).all()
+        self.add_many(rows)
+        seen = np.fromiter((key for key, _ in rows), dtype=np.int64, count=len(rows))
+        with self._lock:
+            if top > self._max_id:
+                skipped = np.setdiff1d(np.arange(max(max_id, self._max_id) + 1, top + 1), seen)
+                self._add_holes(skipped)
+                self._max_id = top
+        return True
+
+    def _add_holes(self, ids: np.ndarray):
+        """Remember ids under _max_id that no read has returned yet (call with _lock held)."""
+        indexed = self._indexed
+        ids = ids[(ids >= len(indexed)) | ~indexed[np.minimum(ids, len(indexed) - 1)]] if len(indexed) else ids
+        deadline = time.monotonic() + NAME_INDEX_HOLE_SECONDS
+        for key in ids.tolist():
+            self._holes.setdefault(key, deadline)
+        excess = len(self._holes) - NAME_INDEX_MAX_HOLES
+        if excess > 0:  # dicts keep insertion order: give up on the oldest
+            for key in list(self._holes)[:excess]:
+                del self._holes[key]
+            self.holes_expired += excess
+
+    def _check_holes(self, db):
+        """Read skipped ids again, at most every NAME_INDEX_HOLE_POLL_SECONDS."""
+        now = time.monotonic()
+        with self._lock:
+            if not self._holes or now - self._holes_checked < NAME_INDEX_HOLE_POLL_SECONDS:
+                return
+            self._holes_checked = now
+            holes = list(self._holes)
+        rows = []
+        for start in range(0, len(holes), NAME_INDEX_LOAD_CHUNK):
+            rows.extend(db.execute(
+                select(self.key_column, self.name_column)
+                .where(self.key_column.in_(holes[start:start + NAME_INDEX_LOAD_CHUNK]))
+            ).all())
+        self.add_many(rows)
+        with self._lock:
+            for key, _ in rows:
+                self._holes.pop(key, None)
+            self.late_rows += len(rows)
+            expired = [key for key, deadline in self._holes.items() if deadline <= now]
+            for key in expired:
+                del self._holes[key]
+            self.holes_expired += len(expired)
+
+    def _rebuild(self, db):
+        started = time.perf_counter()
+        chunks, last_id = [], 0  # per chunk of rows: gram and id of each posting, by gram then id
+        codes = np.empty(0, dtype=np.int64)
+        while True:
+            rows = db.execute(
+                select(self.key_column, self.name_column).where(self.key_column > last_id)
+                .order_by(self.key_column).limit(NAME_INDEX_LOAD_CHUNK)
+            ).all()
+            if not rows:
+                break
+            named = [(key, name) for key, name in rows if name]
+            if named:
+                keys = _name_grams([key for key, _ in named], [name for _, name in named])
+                chunks.append(((keys >> 32).astype(np.uint32), (keys & 0xFFFFFFFF).astype(np.uint32)))
+                codes = np.union1d(codes, chunks[-1][0])
+            last_id = rows[-1][0]
+        # Counting sort: size every gram's list, then copy each chunk's postings into place.
+        # Chunks come in id order, so every list ends up sorted without sorting all postings at once.
+        sizes = np.zeros(len(codes), dtype=np.int64)
+        for chunk_codes, _ in chunks:
+            grams, counts = np.unique(chunk_codes, return_counts=True)
+            sizes[np.searchsorted(codes, grams)] += counts
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        ids = np.empty(offsets[-1], dtype=np.uint32)
+        filled = offsets[:-1].copy()
+        indexed = np.zeros(last_id + 1, dtype=bool)
+        while chunks:
+            chunk_codes, chunk_ids = chunks.pop(0)
+            gram = np.searchsorted(codes, chunk_codes)
+            runs, first, counts = np.unique(gram, return_index=True, return_counts=True)
+            ids[filled[gram] + np.arange(len(gram)) - np.repeat(first, counts)] = chunk_ids
+            filled[runs] += counts
+            indexed[chunk_ids] = True
+        with self._lock:
+            self._codes, self._ids, self._offsets = codes, ids, offsets
+            self._delta, self._delta_postings = {}, 0
+            self._indexed, self._removed = indexed, set()
+            self._max_id = last_id
+            # Rows near the top may have been uncommitted while their chunk was read
+            self._holes, self._holes_checked = {}, 0.0
+            self._add_holes(np.flatnonzero(~indexed[max(1, last_id - NAME_INDEX_LOAD_CHUNK + 1):])
+                            + max(1, last_id - NAME_INDEX_LOAD_CHUNK + 1))
+            self._built = True
+            self.builds += 1
+            self.build_seconds = round(time.perf_counter() - started, 3)
+
+    def search(self, text: str, prefix: bool = False, after: Optional[int] = None) -> Optional[np.ndarray]:
+        """Sorted candidate ids (> after) whose name contains (or starts with) `text`.
+
+        None means the query is too short or uses LIKE wildcards, and the
+        caller should filter by ILIKE alone.
+        """
+        grams = _query_grams(text, prefix)
+        if grams is None:
+            return None
+        with self._lock:
+            self.queries += 1
+            lists = [(self._postings(g), np.array(self._delta.get(g, ()), dtype=np.uint32)) for g in grams.tolist()]
+            removed = np.fromiter(self._removed, dtype=np.uint32, count=len(self._removed))
+        lists.sort(key=lambda p: len(p[0]) + len(p[1]))
+        base, delta = lists[0]
+        candidates = np.union1d(base, delta) if len(delta) else base
+        if after is not None:
+            candidates = candidates[np.searchsorted(candidates, after, side="right"):]
+        for base, delta in lists[1:]:
+            if not len(candidates):
+                break
+            keep = _in_sorted(base, candidates)
+            if len(delta):
+                keep |= np.isin(candidates, delta)
+            candidates = candidates[keep]
+        if len(removed):
+            candidates = candidates[~np.isin(candidates, removed)]
+        return candidates.astype(np.int64)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "built": self._built,
+                "grams": len(self._codes),
+                "postings": len(self._ids) + self._delta_postings,
+                "delta_postings": self._delta_postings,
+                "removed": len(self._removed),
+                "max_id": self._max_id,
+                "holes": len(self._holes),
+                "late_rows": self.late_rows,
+                "holes_expired": self.holes_expired,
+                "bytes": self._codes.nbytes + self._offsets.nbytes + self._ids.nbytes + self._indexed.nbytes,
+                "builds": self.builds,
+                "build_seconds": self.build_seconds,
+                "merges": self.merges,
+                "queries": self.queries,
+            }
+
+
+booking_names = NameIndex(Booking.__table__.c.booking_id, Booking.__table__.c.passenger_name)
+reservation_names = NameIndex(Reservation.__table__.c.reservation_id, Reservation.__table__.c.passenger_name)
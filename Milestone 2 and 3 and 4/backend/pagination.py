@@ -0,0 +1,72 @@
+# pagination.py
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi.responses import StreamingResponse
+
+from db_config import SessionLocal
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+STREAM_BATCH_SIZE = 1000
+CANDIDATE_CHUNK = 1000  # keys per IN (...) when a search index supplies the candidates
+
+def keyset_page(query, key_column, after, limit, response, serialize, candidates=None):
+    """One page ordered by `key_column`, starting after the `after` cursor.
+
+    The cursor for the next page goes in the X-Next-Cursor header (absent on
+    the last page), so the body stays the plain list clients already read.
+    `candidates` (sorted keys past `after`, e.g. from name_index) limits the
+    query to those primary keys, looked up CANDIDATE_CHUNK at a time.
+    """
+    if candidates is not None:
+        rows = []
+        for start in range(0, len(candidates), CANDIDATE_CHUNK):
+            chunk = candidates[start:start + CANDIDATE_CHUNK].tolist()
+            rows += query.filter(key_column.in_(chunk)).order_by(key_column).limit(limit + 1 - len(rows)).all()
+            if len(rows) > limit:
+                break
+    else:
+        if after is not None:
+            query = query.filter(key_column > after)
+        rows = query.order_by(key_column).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(getattr(rows[-1], key_column.key))
+    return [serialize(r) for r in rows]
+
+def column_dict(obj):
+    """Plain dict of a model row's columns (what FastAPI used to build from ORM objects)."""
+    return {c.key: getattr(obj, c.key) for c in obj.__table__.columns}
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def ndjson_stream(build_query, key_column, after, serialize, batch_size=STREAM_BATCH_SIZE, candidates=None):
+    """Stream every matching row as NDJSON with memory bounded by `batch_size`.
+
+    The generator owns its session: the request's session is closed before
+    a streaming body is sent.
+    """
+    def generate():
+        db = SessionLocal()
+        try:
+            query = build_query(db)
+            if candidates is not None:
+                for start in range(0, len(candidates), CANDIDATE_CHUNK):
+                    chunk = candidates[start:start + CANDIDATE_CHUNK].tolist()
+                    for row in query.filter(key_column.in_(chunk)).order_by(key_column):
+                        yield json.dumps(serialize(row), default=_json_default) + "\n"
+                return
+            if after is not None:
+                query = query.filter(key_column > after)
+            for row in query.order_by(key_column).yield_per(batch_size):
+                yield json.dumps(serialize(row), default=_json_default) + "\n"
+        finally:
+            db.close()
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
\ No newline at end of file
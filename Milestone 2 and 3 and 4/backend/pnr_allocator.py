@@ -0,0 +1,81 @@
+# pnr_allocator.py
+import os
+import string
+import threading
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from db_config import engine
+from models import PnrBlock
+
+PNR_BLOCK_SIZE = int(os.getenv("PNR_BLOCK_SIZE", "1000"))
+
+ALPHABET = string.ascii_uppercase + string.digits  # same characters as utils.generate_pnr
+PNR_LENGTH = 8
+PNR_SPACE = len(ALPHABET) ** PNR_LENGTH
+# Odd and not a multiple of 3, so coprime with 36**8: the affine map below is a
+# bijection on [0, PNR_SPACE); ~0.618 * PNR_SPACE spreads consecutive counters apart
+SCRAMBLE_MULTIPLIER = 1743541808807
+SCRAMBLE_OFFSET = 1000003147
+
+pnr_blocks = PnrBlock.__table__
+
+
+def encode_pnr(value: int) -> str:
+    """Map a counter value to a unique `PNR` + 8-character code."""
+    value = (value * SCRAMBLE_MULTIPLIER + SCRAMBLE_OFFSET) % PNR_SPACE
+    chars = []
+    for _ in range(PNR_LENGTH):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return "PNR" + "".join(reversed(chars))
+
+
+class PnrAllocator:
+    """Hands out PNRs from counter blocks leased from the `pnr_blocks` table.
+
+    Each process leases `block_size` counter values in one short transaction
+    of its own, then encodes them locally, so PNRs are unique across
+    processes without a lookup per booking.
+    """
+
+    def __init__(self, name: str = "bookings", block_size: int = PNR_BLOCK_SIZE):
+        self.name = name
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def _lease_block(self):
+        for _ in range(2):
+            with engine.begin() as conn:
+                start = conn.execute(
+                    select(pnr_blocks.c.next_value).where(pnr_blocks.c.name == self.name).with_for_update()
+                ).scalar()
+                if start is not None:
+                    conn.execute(update(pnr_blocks).where(pnr_blocks.c.name == self.name)
+                                 .values(next_value=start + self.block_size))
+                    self._next, self._end = start, start + self.block_size
+                    return
+            self._create_sequence()
+        raise RuntimeError(f"PNR sequence {self.name!r} could not be created")
+
+    def _create_sequence(self):
+        """Insert the counter row if it is missing (migration 002 seeds it); losing the race is fine."""
+        try:
+            with engine.begin() as conn:
+                conn.execute(insert(pnr_blocks).values(name=self.name, next_value=1))
+        except IntegrityError:
+            pass  # another process created it first; lease from its row
+
+    def next_pnr(self) -> str:
+        with self._lock:
+            if self._next >= self._end:
+                self._lease_block()
+            value = self._next
+            self._next += 1
+        return encode_pnr(value)
+
+
+pnr_allocator = PnrAllocator()
\ No newline at end of file
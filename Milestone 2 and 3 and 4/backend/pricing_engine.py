@@ -2,17 +2,47 @@
 import random
 from datetime import datetime
 
-def calculate_dynamic_price(base_fare, seats_available, capacity, departure_time):
+import numpy as np
+
+from instrumentation import timed
+
+@timed("calculate_dynamic_price")
+def calculate_dynamic_price(base_fare, seats_available, capacity, departure_time, now=None, rng=None):
     capacity = capacity or 1
     seats_available = seats_available if seats_available is not None else capacity
     seat_factor = (1 - (seats_available / capacity)) * 0.4
-    hours_left = max((departure_time - datetime.now()).total_seconds() / 3600, 0) if departure_time else 0
+    hours_left = max((departure_time - (now or datetime.now())).total_seconds() / 3600, 0) if departure_time else 0
     if hours_left < 24:
         time_factor = 0.5
     elif hours_left < 72:
         time_factor = 0.3
     else:
         time_factor = 0.1
-    demand_factor = random.uniform(-0.05, 0.25)
+    demand_factor = (rng or random).uniform(-0.05, 0.25)
+    multiplier = 1 + seat_factor + time_factor + demand_factor
+    return round(float(base_fare) * multiplier, 2)
+
+@timed("calculate_dynamic_prices")
+def calculate_dynamic_prices(base_fares, seats_available, capacities, departure_times, now=None, rng=None):
+    """Batch version of calculate_dynamic_price: one shared `now`, one RNG draw per flight.
+
+    Inputs are equal-length sequences or arrays; departure times may be
+    datetimes or datetime64 values. Missing values (None/NaN/NaT) follow
+    the scalar rules. Pass a seeded numpy Generator as `rng` for
+    reproducible prices.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    now = np.datetime64(now or datetime.now(), "s")
+    base = np.asarray(base_fares, dtype=float)
+    capacity = np.asarray(capacities, dtype=float)
+    capacity = np.where(np.isnan(capacity) | (capacity == 0), 1.0, capacity)
+    seats = np.asarray(seats_available, dtype=float)
+    seats = np.where(np.isnan(seats), capacity, seats)
+    seat_factor = (1 - (seats / capacity)) * 0.4
+    departures = np.asarray(departure_times, dtype="datetime64[s]")
+    hours_left = (departures - now) / np.timedelta64(1, "h")
+    hours_left = np.where(np.isnat(departures), 0.0, np.maximum(hours_left, 0))
+    time_factor = np.where(hours_left < 24, 0.5, np.where(hours_left < 72, 0.3, 0.1))
+    demand_factor = rng.uniform(-0.05, 0.25, size=base.shape)
     multiplier = 1 + seat_factor + time_factor + demand_factor
-    return round(float(base_fare) * multiplier, 2)
\ No newline at end of file
+    return np.round(base * multiplier, 2)
\ No newline at end of file
@@ -0,0 +1,137 @@
+# provider_feed.py
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from flight_snapshot import FlightColumns, FlightSnapshot, NO_TIME
+
+FEED_CACHE_SIZE = int(os.getenv("FEED_CACHE_SIZE", "64"))  # built feeds kept per worker
+FEED_MAX_STALENESS = float(os.getenv("FEED_MAX_STALENESS", "2"))  # seconds a built feed is reused after a change
+FEED_DELTA_OVERLAP_MS = int(os.getenv("FEED_DELTA_OVERLAP_MS", "5000"))  # re-sent margin for lagging workers
+FEED_GZIP_LEVEL = int(os.getenv("FEED_GZIP_LEVEL", "6"))
+FEED_FORMATS = ("ndjson", "columns")
+
+_compact = json.JSONEncoder(separators=(",", ":")).encode
+
+
+class Feed(NamedTuple):
+    version: int
+    etag: str
+    body: bytes  # gzip-compressed
+    records: int
+    built_at: float
+
+
+def feed_etag(provider: str, fmt: str, since: Optional[int], version: int) -> str:
+    key = f"{provider}\0{fmt}\0{since}\0{version}".encode()
+    return '"' + hashlib.sha256(key).hexdigest()[:32] + '"'
+
+
+def _times(epochs: np.ndarray):
+    text = np.datetime_as_string(epochs.astype("datetime64[s]")).tolist()
+    return [None if t == "NaT" else t.replace("T", " ") for t in text]
+
+
+def _optional(values: np.ndarray, cast):
+    return [None if np.isnan(v) else cast(v) for v in values.tolist()]
+
+
+def render_ndjson(columns: FlightColumns, positions: np.ndarray, removed, provider: str) -> bytes:
+    """One /external_api/{provider}/flights record per line, then a deleted marker per removed code."""
+    prefix = _compact({"provider": provider})[:-1] + ',"airline_code":'
+    lines = [f"{prefix}{_compact(columns.codes[i])},{columns.provider_json[i]}}}" for i in positions.tolist()]
+    lines += [f"{prefix}{_compact(code)},\"status\":\"deleted\"}}" for code in removed]
+    return ("\n".join(lines) + "\n" if lines else "").encode()
+
+
+def render_columns(columns: FlightColumns, positions: np.ndarray, removed, provider: str) -> bytes:
+    """The same records as one JSON object of parallel arrays (field names written once)."""
+    return _compact({
+        "provider": provider,
+        "airline_code": [columns.codes[i] for i in positions.tolist()],
+        "origin": [columns.shape[i][0] for i in positions.tolist()],
+        "destination": [columns.shape[i][1] for i in positions.tolist()],
+        "departure_time": _times(columns.departures[positions]),
+        "arrival_time": _times(columns.arrivals[positions]),
+        "base_fare": _optional(columns.fares[positions], float),
+        "seats_left": _optional(columns.seats[positions], int),
+        "deleted": list(removed),
+    }).encode()
+
+
+RENDERERS = {"ndjson": render_ndjson, "columns": render_columns}
+
+
+class ProviderFeedCache:
+    """Gzipped schedule feeds per (provider, format, since), rebuilt when the flight snapshot changes.
+
+    A feed built within FEED_MAX_STALENESS seconds is served even if seats
+    moved since, so a burst of bookings does not rebuild it per poll; its
+    ETag names the version it was built from. Deltas contain every flight
+    changed after `since - FEED_DELTA_OVERLAP_MS`: other workers apply the
+    same change a little later, so a small overlap is re-sent rather than
+    risking a gap. Consumers upsert records by airline_code.
+    """
+
+    def __init__(self, max_entries: int = FEED_CACHE_SIZE, max_staleness: float = FEED_MAX_STALENESS):
+        self.max_entries = max_entries
+        self.max_staleness = max_staleness
+        self._feeds = OrderedDict()  # (provider, fmt, since) -> Feed
+        self._lock = threading.Lock()
+        self.hits = self.builds = self.evictions = 0
+        self.bytes_built = 0
+
+    def get(self, snapshot: FlightSnapshot, columns: FlightColumns, provider: str,
+            fmt: str = "ndjson", since: Optional[int] = None) -> Feed:
+        key = (provider, fmt, since)
+        version = snapshot.version
+        with self._lock:
+            feed = self._feeds.get(key)
+            if feed is not None and (feed.version == version or time.monotonic() - feed.built_at < self.max_staleness):
+                self._feeds.move_to_end(key)
+                self.hits += 1
+                return feed
+        feed = self._build(snapshot, columns, provider, fmt, since, version)
+        with self._lock:
+            self._feeds[key] = feed
+            self._feeds.move_to_end(key)
+            self.builds += 1
+            self.bytes_built += len(feed.body)
+            while len(self._feeds) > self.max_entries:
+                self._feeds.popitem(last=False)
+                self.evictions += 1
+        return feed
+
+    def _build(self, snapshot, columns, provider, fmt, since, version) -> Feed:
+        if since is None:
+            positions = np.arange(len(columns.codes))
+            removed = []
+        else:
+            cutoff = since - FEED_DELTA_OVERLAP_MS
+            positions = np.flatnonzero(columns.versions > cutoff)
+            removed = sorted(code for code, at in list(snapshot.removed.items()) if at > cutoff)
+        raw = RENDERERS[fmt](columns, positions, removed, provider)
+        return Feed(version, feed_etag(provider, fmt, since, version),
+                    gzip.compress(raw, FEED_GZIP_LEVEL), len(positions) + len(removed), time.monotonic())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._feeds),
+                "max_entries": self.max_entries,
+                "max_staleness_seconds": self.max_staleness,
+                "hits": self.hits,
+                "builds": self.builds,
+                "evictions": self.evictions,
+                "bytes_built": self.bytes_built,
+            }
+
+
+provider_feeds = ProviderFeedCache()
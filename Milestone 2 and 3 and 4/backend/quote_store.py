@@ -0,0 +1,147 @@
+# quote_store.py
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from coordination import coordinator
+
+QUOTE_TTL_SECONDS = float(os.getenv("QUOTE_TTL_SECONDS", "300"))
+QUOTE_STORE_SIZE = int(os.getenv("QUOTE_STORE_SIZE", "100000"))
+# Every worker must sign with the same key so any of them accepts a quote another issued: set
+# QUOTE_SECRET, or leave it empty to share a random key through the coordination backend
+QUOTE_SECRET = os.getenv("QUOTE_SECRET", "").encode()
+_secret = None
+_secret_lock = threading.Lock()
+
+
+class InvalidQuote(ValueError):
+    pass
+
+
+class Quote(NamedTuple):
+    airline_id: int
+    price: float
+    expires_at: int  # epoch seconds
+    token: str
+
+
+def _signing_key() -> bytes:
+    global _secret
+    if _secret is None:
+        with _secret_lock:
+            if _secret is None:
+                _secret = QUOTE_SECRET or coordinator.backend.shared_secret("quote_secret")
+    return _secret
+
+def _signature(payload: str) -> str:
+    digest = hmac.new(_signing_key(), payload.encode(), hashlib.sha256).digest()[:18]
+    return base64.urlsafe_b64encode(digest).decode()
+
+def sign_quote(airline_id: int, price: float, expires_at: float) -> str:
+    """Token `<airline_id>.<price in paise>.<expiry epoch>.<hmac>`, verifiable by any worker."""
+    payload = f"{airline_id}.{int(round(price * 100))}.{int(expires_at)}"
+    return f"{payload}.{_signature(payload)}"
+
+
+class QuoteStore:
+    """Live price quote per flight: LRU-bounded, each entry dropped once its quote expires.
+
+    Repeated searches within a quote's lifetime return the same price and
+    token instead of repricing. Verification needs only the signature, so a
+    booking can present a quote this worker never stored.
+    """
+
+    def __init__(self, max_entries: int = QUOTE_STORE_SIZE, ttl_seconds: float = QUOTE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._quotes = OrderedDict()  # airline_id -> Quote
+        self._lock = threading.Lock()
+        self.issued = self.reused = self.evictions = self.expirations = self.rejected = 0
+
+    def live(self, airline_id: int, now: Optional[float] = None) -> Optional[Quote]:
+        now = now or time.time()
+        with self._lock:
+            quote = self._quotes.get(airline_id)
+            if quote is None:
+                return None
+            # Keep a margin so a quote handed out is still good when the booking arrives
+            if quote.expires_at - self.ttl_seconds / 4 <= now:
+                del self._quotes[airline_id]
+                self.expirations += 1
+                return None
+            self._quotes.move_to_end(airline_id)
+            self.reused += 1
+            return quote
+
+    def issue(self, airline_id: int, price: float, now: Optional[float] = None) -> Quote:
+        now = now or time.time()
+        expires_at = int(now + self.ttl_seconds)
+        quote = Quote(airline_id, round(float(price), 2), expires_at, sign_quote(airline_id, price, expires_at))
+        with self._lock:
+            while self._quotes and next(iter(self._quotes.values())).expires_at <= now:
+                self._quotes.popitem(last=False)
+                self.expirations += 1
+            self._quotes[airline_id] = quote
+            self._quotes.move_to_end(airline_id)
+            self.issued += 1
+            while len(self._quotes) > self.max_entries:
+                self._quotes.popitem(last=False)
+                self.evictions += 1
+        return quote
+
+    def verify(self, token: str, airline_id: int, now: Optional[float] = None) -> Optional[float]:
+        """Quoted price if `token` is a genuine quote for this flight, None once it has expired.
+
+        Raises InvalidQuote for a forged, altered or other-flight token.
+        """
+        try:
+            quoted_id, paise, expires_at = self._check(token, airline_id)
+        except InvalidQuote:
+            with self._lock:
+                self.rejected += 1
+            raise
+        if expires_at <= (now or time.time()):
+            return None
+        return paise / 100
+
+    @staticmethod
+    def _check(token: str, airline_id: int):
+        try:
+            quoted_id, paise, expires_at, signature = token.split(".")
+            quoted_id, paise, expires_at = int(quoted_id), int(paise), int(expires_at)
+        except ValueError:
+            raise InvalidQuote("Malformed quote")
+        if not hmac.compare_digest(signature, _signature(f"{quoted_id}.{paise}.{expires_at}")):
+            raise InvalidQuote("Invalid quote signature")
+        if quoted_id != airline_id:
+            raise InvalidQuote("Quote is for a different flight")
+        return quoted_id, paise, expires_at
+
+    def invalidate(self, airline_id: Optional[int] = None):
+        """Stop reusing quotes once seats or fares change (issued tokens stay valid until they expire)."""
+        with self._lock:
+            if airline_id is None:
+                self._quotes.clear()
+            else:
+                self._quotes.pop(airline_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._quotes),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "issued": self.issued,
+                "reused": self.reused,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "rejected": self.rejected,
+            }
+
+
+quote_store = QuoteStore()
\ No newline at end of file
@@ -0,0 +1,152 @@
+# receipt_service.py
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfgen import canvas
+
+from instrumentation import section_timer
+
+RECEIPT_WORKERS = int(os.getenv("RECEIPT_WORKERS", "2"))
+RECEIPT_CACHE_SIZE = int(os.getenv("RECEIPT_CACHE_SIZE", "1024"))  # rendered PDFs kept per process
+
+def booking_receipt(booking, airline):
+    """(pnr, lines, version) for a Booking and its Airline (which may be None)."""
+    lines = [
+        f"PNR: {booking.pnr}",
+        f"Passenger: {booking.passenger_name}",
+        f"Seat Number: {booking.seat_number}",
+        f"Status: {booking.status}",
+        f"Price: ₹{float(booking.price) if booking.price else 0.0}",
+    ]
+    if airline:
+        lines += [
+            f"Airline Code: {airline.airline_code}",
+            f"Route: {airline.origin_city} → {airline.destination_city}",
+            f"Departure: {airline.departure_time.strftime('%Y-%m-%d %H:%M:%S')}",
+            f"Arrival: {airline.arrival_time.strftime('%Y-%m-%d %H:%M:%S')}",
+        ]
+    if booking.updated_at:
+        # The booking's last change, not the render time: the PDF is cached and ETagged by these lines
+        lines.insert(0, f"Issued On: {booking.updated_at.strftime('%Y-%m-%d %H:%M:%S')}")
+    version = booking.updated_at.isoformat() if booking.updated_at else ""
+    return booking.pnr, lines, version
+
+def reservation_receipt(res):
+    """(pnr, lines, version) for a legacy Reservation."""
+    lines = [
+        f"Reservation ID: {res.reservation_id}",
+        f"Transaction ID: {res.transaction_id}",
+        f"Passenger: {res.passenger_name}",
+        f"Airline Code: {res.airline_code}",
+        f"Seat Number: {res.seat_number}",
+    ]
+    return str(res.reservation_id), lines, ""
+
+def render_receipt_pdf(lines):
+    """Draw a receipt PDF; runs in a worker process so it must stay importable and picklable."""
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+
+    pdf.setFont("Helvetica-Bold", 16)
+    pdf.drawString(200, 800, "Airline Booking Receipt")
+    pdf.setFont("Helvetica", 12)
+
+    y = 770
+    for line in lines:
+        pdf.drawString(100, y, line)
+        y -= 20
+
+    pdf.setFont("Helvetica-Oblique", 10)
+    pdf.drawString(100, 100, "Thank you for booking with our Airline Simulator!")
+    pdf.save()
+    return buffer.getvalue()
+
+def receipt_etag(pnr, lines, version):
+    """Content address of a receipt: changes whenever anything printed on it (or updated_at) does."""
+    digest = hashlib.sha256("\0".join([pnr, version, *lines]).encode("utf-8")).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+class ReceiptService:
+    """Renders receipts in a process pool and keeps the PDFs in an LRU keyed by ETag."""
+
+    def __init__(self, workers: int = RECEIPT_WORKERS, cache_size: int = RECEIPT_CACHE_SIZE):
+        self.workers = workers
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # etag -> pdf bytes
+        self._lock = threading.Lock()
+        self._pool = None
+        self.hits = self.misses = 0
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _cached(self, etag):
+        with self._lock:
+            pdf = self._cache.get(etag)
+            if pdf is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._cache.move_to_end(etag)
+            return pdf
+
+    def _store(self, etag, pdf):
+        with self._lock:
+            self._cache[etag] = pdf
+            self._cache.move_to_end(etag)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def get(self, receipt):
+        """(etag, pdf) for one (pnr, lines, version) receipt."""
+        etag = receipt_etag(*receipt)
+        pdf = self._cached(etag)
+        if pdf is None:
+            with section_timer("pdf_render"):
+                pdf = self._executor().submit(render_receipt_pdf, receipt[1]).result()
+            self._store(etag, pdf)
+        return etag, pdf
+
+    def get_many(self, receipts):
+        """[(etag, pdf)] for many receipts, rendering the uncached ones in parallel."""
+        etags = [receipt_etag(*r) for r in receipts]
+        pdfs = [self._cached(etag) for etag in etags]
+        missing = [i for i, pdf in enumerate(pdfs) if pdf is None]
+        if missing:
+            with section_timer("pdf_render"):
+                rendered = list(self._executor().map(render_receipt_pdf, [receipts[i][1] for i in missing]))
+            for i, pdf in zip(missing, rendered):
+                pdfs[i] = pdf
+                self._store(etags[i], pdf)
+        return list(zip(etags, pdfs))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._cache),
+                "max_entries": self.cache_size,
+                "workers": self.workers,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+
+receipt_service = ReceiptService()
\ No newline at end of file
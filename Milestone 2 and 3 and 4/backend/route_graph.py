@@ -0,0 +1,264 @@
+# route_graph.py
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import select
+
+from models import Airline
+from utils import flight_duration_minutes
+
+ROUTE_MIN_LAYOVER_MINUTES = int(os.getenv("ROUTE_MIN_LAYOVER_MINUTES", "45"))
+ROUTE_MAX_LAYOVER_MINUTES = int(os.getenv("ROUTE_MAX_LAYOVER_MINUTES", "720"))
+ROUTE_MAX_ITINERARIES = int(os.getenv("ROUTE_MAX_ITINERARIES", "5000"))  # candidates ranked per query
+ROUTE_REBUILD_SECONDS = float(os.getenv("ROUTE_REBUILD_SECONDS", "900"))  # catches flights added outside the API
+ROUTE_LOAD_CHUNK = 5000
+
+airlines = Airline.__table__
+
+LEG_COLUMNS = (
+    airlines.c.airline_id, airlines.c.airline_code, airlines.c.operator_name,
+    airlines.c.origin_city, airlines.c.destination_city, airlines.c.departure_time, airlines.c.arrival_time,
+    airlines.c.ticket_price, airlines.c.capacity, airlines.c.available_seats,
+)
+
+
+class Leg(NamedTuple):
+    """One flight as the graph sees it; attribute names match Airline so /search helpers accept it."""
+    airline_id: int
+    airline_code: str
+    operator_name: Optional[str]
+    origin_city: str
+    destination_city: str
+    departure_time: datetime
+    arrival_time: datetime
+    ticket_price: Optional[float]
+    capacity: Optional[int]
+    available_seats: Optional[int]
+
+
+class Itinerary(NamedTuple):
+    legs: Tuple[Leg, ...]
+    duration_minutes: int  # first departure to last arrival, layovers included
+
+    @property
+    def layover_minutes(self) -> List[int]:
+        return [flight_duration_minutes(a.arrival_time, b.departure_time) for a, b in zip(self.legs, self.legs[1:])]
+
+
+class RouteGraph:
+    """Flights indexed by origin city and by city pair, each list sorted by departure time.
+
+    Connections are found by walking the index in memory: after each leg,
+    only departures inside the layover window of its destination are
+    considered, located by bisection, and the last leg is looked up on the
+    city pair that ends at the destination. Changed flights are marked and
+    reloaded with one query on the next search; a market tick (or
+    ROUTE_REBUILD_SECONDS) marks everything for a full reload.
+
+    Reloads never edit a list in place: they swap in copies, so a search
+    walks whatever index it picked up under the lock without holding it.
+    """
+
+    def __init__(self, rebuild_seconds: float = ROUTE_REBUILD_SECONDS):
+        self.rebuild_seconds = rebuild_seconds
+        self._legs: Dict[int, Leg] = {}
+        # origin city or (origin, destination) -> sorted (departure, airline_id) keys and legs in that order
+        self._keys: Dict[object, List[Tuple[datetime, int]]] = {}
+        self._index: Dict[object, List[Leg]] = {}
+        self._stale = set()
+        self._full_reload = True
+        self._built_at = 0.0
+        self._built = False
+        self._building = False
+        self._generation = 0  # bumped by every full rebuild swap
+        self._reloaded_during_build = set()  # re-marked after the swap, which replaces those reloads
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # held by full rebuilds; the first one is waited for
+        self.rebuilds = self.partial_reloads = self.queries = 0
+
+    def mark_changed(self, *airline_ids):
+        with self._lock:
+            self._stale.update(airline_ids)
+
+    def mark_all_changed(self):
+        with self._lock:
+            self._full_reload = True
+
+    def _replace(self, airline_ids, legs: List[Leg]):
+        """Swap these flights for their reloaded legs, copying each index list touched (caller holds the lock)."""
+        keys, index, copied = dict(self._keys), dict(self._index), set()
+
+        def lists(index_key):
+            if index_key not in copied:
+                copied.add(index_key)
+                keys[index_key] = list(keys.get(index_key, ()))
+                index[index_key] = list(index.get(index_key, ()))
+            return keys[index_key], index[index_key]
+
+        for airline_id in airline_ids:
+            leg = self._legs.pop(airline_id, None)
+            if leg is None:
+                continue
+            for index_key in (leg.origin_city, (leg.origin_city, leg.destination_city)):
+                index_keys, index_legs = lists(index_key)
+                i = bisect_left(index_keys, (leg.departure_time, leg.airline_id))
+                del index_keys[i], index_legs[i]
+        for leg in legs:
+            for index_key in (leg.origin_city, (leg.origin_city, leg.destination_city)):
+                index_keys, index_legs = lists(index_key)
+                i = bisect_left(index_keys, (leg.departure_time, leg.airline_id))
+                index_keys.insert(i, (leg.departure_time, leg.airline_id))
+                index_legs.insert(i, leg)
+            self._legs[leg.airline_id] = leg
+        self._keys, self._index = keys, index
+
+    @staticmethod
+    def _leg(row) -> Optional[Leg]:
+        if row.departure_time is None or row.arrival_time is None or not row.origin_city:
+            return None
+        return Leg(row.airline_id, row.airline_code, row.operator_name, row.origin_city, row.destination_city,
+                   row.departure_time, row.arrival_time,
+                   float(row.ticket_price) if row.ticket_price is not None else None,
+                   row.capacity, row.available_seats)
+
+    @property
+    def ready(self) -> bool:
+        return self._built
+
+    def ensure_fresh(self, db):
+        """Apply pending flight changes: a full rebuild if one is due, else reload only the marked flights.
+
+        Until the first build is done, other requests wait for it instead of
+        searching an empty graph; check `ready` afterwards in case it failed.
+        """
+        with self._lock:
+            full = self._full_reload or (self._built and time.monotonic() - self._built_at >= self.rebuild_seconds)
+            stale, self._stale = self._stale, set()
+            self._full_reload = False
+            generation = self._generation
+        if full:
+            with self._build_lock:
+                try:
+                    self._rebuild(db)
+                except Exception:
+                    with self._lock:
+                        self._building = False
+                        self._reloaded_during_build.clear()
+                    self.mark_all_changed()  # retried by the next search
+                    raise
+            return
+        if not self._built:
+            with self._build_lock:
+                pass
+        if stale:
+            stale, rows = sorted(stale), []
+            for start in range(0, len(stale), ROUTE_LOAD_CHUNK):
+                chunk = stale[start:start + ROUTE_LOAD_CHUNK]
+                rows.extend(db.execute(select(*LEG_COLUMNS).where(airlines.c.airline_id.in_(chunk))).all())
+            with self._lock:
+                if self._generation != generation:
+                    # A rebuild swapped in rows that may be newer than these; reload them again
+                    self._stale.update(stale)
+                    return
+                if self._building:
+                    self._reloaded_during_build.update(stale)
+                self._replace(stale, [leg for leg in map(self._leg, rows) if leg is not None])
+                self.partial_reloads += 1
+
+    def _rebuild(self, db):
+        with self._lock:
+            self._building = True
+        legs, last_id = [], 0
+        while True:
+            rows = db.execute(
+                select(*LEG_COLUMNS).where(airlines.c.airline_id > last_id)
+                .order_by(airlines.c.airline_id).limit(ROUTE_LOAD_CHUNK)
+            ).all()
+            if not rows:
+                break
+            legs.extend(leg for leg in map(self._leg, rows) if leg is not None)
+            last_id = rows[-1].airline_id
+        index: Dict[object, List[Leg]] = {}
+        for leg in sorted(legs, key=lambda l: (l.departure_time, l.airline_id)):
+            index.setdefault(leg.origin_city, []).append(leg)
+            index.setdefault((leg.origin_city, leg.destination_city), []).append(leg)
+        with self._lock:
+            self._legs = {leg.airline_id: leg for leg in legs}
+            self._index = index
+            self._keys = {index_key: [(l.departure_time, l.airline_id) for l in index_legs]
+                          for index_key, index_legs in index.items()}
+            self._built_at = time.monotonic()
+            self._built = True
+            self._building = False
+            self._generation += 1
+            # Reloads that ran while these rows were being read were applied to the old graph
+            self._stale.update(self._reloaded_during_build)
+            self._reloaded_during_build.clear()
+            self.rebuilds += 1
+
+    @staticmethod
+    def _departures(keys, index, index_key, earliest: datetime, latest: datetime) -> List[Leg]:
+        index_keys = keys.get(index_key)
+        if not index_keys:
+            return []
+        lo = bisect_left(index_keys, (earliest, -1))
+        hi = bisect_right(index_keys, (latest, float("inf")))
+        return index[index_key][lo:hi]
+
+    def connections(self, origin_city: str, destination_city: str, day=None, max_stops: int = 2,
+                    min_layover: timedelta = timedelta(minutes=ROUTE_MIN_LAYOVER_MINUTES),
+                    max_layover: timedelta = timedelta(minutes=ROUTE_MAX_LAYOVER_MINUTES),
+                    now: Optional[datetime] = None,
+                    max_itineraries: int = ROUTE_MAX_ITINERARIES) -> List[Itinerary]:
+        """Itineraries of up to `max_stops` connections, first leg departing on `day` (or any time ahead).
+
+        Every leg must have a free seat and leave at least `min_layover` and
+        at most `max_layover` after the previous one lands; no city is
+        visited twice.
+        """
+        now = now or datetime.now()
+        if day:
+            start = max(now, datetime.combine(day, datetime.min.time()))
+            end = datetime.combine(day, datetime.min.time()) + timedelta(days=1) - timedelta(microseconds=1)
+        else:
+            start, end = now, datetime.max
+        found: List[Itinerary] = []
+        with self._lock:
+            self.queries += 1
+            keys, index = self._keys, self._index
+        first = self._departures(keys, index, origin_city if max_stops else (origin_city, destination_city), start, end)
+        stack = [(leg,) for leg in reversed(first) if leg.available_seats and leg.destination_city != origin_city]
+        while stack and len(found) < max_itineraries:
+            legs = stack.pop()
+            last = legs[-1]
+            if last.destination_city == destination_city:
+                found.append(Itinerary(legs, flight_duration_minutes(legs[0].departure_time, last.arrival_time)))
+                continue
+            # Only a leg into the destination may follow once the stop budget is spent
+            city = last.destination_city
+            onward = self._departures(keys, index, city if len(legs) < max_stops else (city, destination_city),
+                                      last.arrival_time + min_layover, last.arrival_time + max_layover)
+            for leg in reversed(onward):
+                if leg.available_seats and all(leg.destination_city != l.origin_city for l in legs):
+                    stack.append(legs + (leg,))
+        return found
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self._built,
+                "flights": len(self._legs),
+                "cities": sum(1 for index_key in self._index if isinstance(index_key, str)),
+                "pending_changes": len(self._stale),
+                "full_reload_pending": self._full_reload,
+                "rebuilds": self.rebuilds,
+                "partial_reloads": self.partial_reloads,
+                "queries": self.queries,
+            }
+
+
+route_graph = RouteGraph()
@@ -0,0 +1,108 @@
+# search_cache.py
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "2048"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "30"))
+
+
+class SearchCache:
+    """LRU + TTL cache of `/search` base rows keyed on (origin, destination, date, sort_by).
+
+    Only seat/fare inputs are cached; dynamic prices are computed per
+    request from them. Entries are indexed by route so a seat change on one
+    flight drops just the searches that could have returned it. A result
+    is only stored if its route was not invalidated while it was queried:
+    callers take generation() before the query and hand it to put().
+
+    It serves the ORM path of /search, i.e. only with FLIGHT_SNAPSHOT=0;
+    the flight snapshot replaces it otherwise.
+    """
+
+    def __init__(self, max_entries: int = SEARCH_CACHE_SIZE, ttl_seconds: float = SEARCH_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._routes = defaultdict(set)  # (origin, destination) -> keys
+        self._generations = defaultdict(int)  # (origin, destination) -> invalidations so far
+        self._epoch = 0  # bumped by clear()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = self.stale_puts = 0
+
+    def _drop(self, key):
+        self._entries.pop(key, None)
+        route = key[:2]
+        keys = self._routes.get(route)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._routes[route]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self, key):
+        """Token for put(): changes when the key's route is invalidated or the cache cleared."""
+        with self._lock:
+            return self._epoch, self._generations.get(key[:2], 0)
+
+    def put(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(key[:2], 0)):
+                self.stale_puts += 1  # computed before an invalidation; the next search queries again
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            self._routes[key[:2]].add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate_route(self, origin_city, destination_city):
+        with self._lock:
+            self._generations[(origin_city, destination_city)] += 1
+            for key in list(self._routes.get((origin_city, destination_city), ())):
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._generations.clear()
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._routes.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+            }
+
+
+search_cache = SearchCache()
\ No newline at end of file
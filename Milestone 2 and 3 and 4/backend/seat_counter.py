@@ -0,0 +1,43 @@
+# seat_counter.py
+import os
+
+from sqlalchemy import case, update
+from sqlalchemy.exc import OperationalError
+
+from models import Airline
+
+# "lock": SELECT ... FOR UPDATE on the flight row for the whole booking (default)
+# "optimistic": read unlocked, then one conditional UPDATE of available_seats just before the insert
+SEAT_CONCURRENCY = os.getenv("SEAT_CONCURRENCY", "lock")
+OPTIMISTIC_SEATS = SEAT_CONCURRENCY == "optimistic"
+SEAT_CONFLICT_RETRIES = int(os.getenv("SEAT_CONFLICT_RETRIES", "3"))
+
+airlines = Airline.__table__
+
+
+class SeatConflict(Exception):
+    """Another transaction won a race for the same seat or row; the attempt can be retried."""
+
+
+def take_seats(db, airline_id, count=1) -> bool:
+    """Atomically take `count` seats off the flight's counter; False if fewer are left."""
+    result = db.execute(
+        update(airlines)
+        .where(airlines.c.airline_id == airline_id, airlines.c.available_seats >= count)
+        .values(available_seats=airlines.c.available_seats - count)
+    )
+    return result.rowcount == 1
+
+def return_seats(db, airline_id, count=1):
+    """Atomically give `count` seats back, never above capacity."""
+    restored = airlines.c.available_seats + count
+    db.execute(
+        update(airlines)
+        .where(airlines.c.airline_id == airline_id)
+        .values(available_seats=case((restored > airlines.c.capacity, airlines.c.capacity), else_=restored))
+    )
+
+def is_lock_conflict(error: OperationalError) -> bool:
+    """InnoDB deadlock / lock wait timeout (or SQLite's busy database): safe to retry."""
+    code = error.orig.args[0] if getattr(error.orig, "args", None) else None
+    return code in (1205, 1213) or "database is locked" in str(error.orig).lower()
\ No newline at end of file
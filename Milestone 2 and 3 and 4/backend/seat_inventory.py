@@ -0,0 +1,156 @@
+# seat_inventory.py
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models import Booking
+
+FREE = 0
+TAKEN = 1
+
+
+class SeatMap:
+    """Compact seat map for one flight: one byte per seat, offset N is seat N."""
+    __slots__ = ("capacity", "free_count", "_seats", "_hint")
+
+    def __init__(self, capacity: int, taken: Iterable[int] = ()):
+        self.capacity = capacity
+        self._seats = bytearray(capacity + 1)
+        self._seats[0] = TAKEN  # there is no seat 0
+        self.free_count = capacity
+        self._hint = 1  # every seat below the hint is taken
+        for seat in taken:
+            self.take(seat)
+
+    def is_free(self, seat: int) -> bool:
+        return 1 <= seat <= self.capacity and self._seats[seat] == FREE
+
+    def take(self, seat: int) -> bool:
+        if not self.is_free(seat):
+            return False
+        self._seats[seat] = TAKEN
+        self.free_count -= 1
+        return True
+
+    def release(self, seat: int):
+        if 1 <= seat <= self.capacity and self._seats[seat] == TAKEN:
+            self._seats[seat] = FREE
+            self.free_count += 1
+            self._hint = min(self._hint, seat)
+
+    def allocate(self) -> Optional[int]:
+        """Take the lowest free seat, or return None when the flight is full."""
+        seat = self._seats.find(FREE, self._hint)
+        if seat == -1:
+            self._hint = self.capacity + 1
+            return None
+        self._seats[seat] = TAKEN
+        self.free_count -= 1
+        self._hint = seat + 1
+        return seat
+
+    def allocate_seats(self, count: int, contiguous: bool = True) -> List[int]:
+        """Take `count` seats: an adjacent run if asked for and available, else the lowest free ones."""
+        if count > self.free_count:
+            return []
+        if contiguous:
+            start = self._seats.find(bytes(count), self._hint)  # run of FREE bytes
+            if start != -1:
+                self._seats[start:start + count] = bytes([TAKEN]) * count
+                self.free_count -= count
+                if start == self._hint:
+                    self._hint = start + count
+                return list(range(start, start + count))
+        return [self.allocate() for _ in range(count)]
+
+
+class SeatInventory:
+    """Process-wide cache of seat maps, loaded from `bookings` once per flight.
+
+    A seat is taken while a booking row holds its number, mirroring the
+    `ux_airline_seat (airline_id, seat_number)` unique key; cancelled and
+    failed bookings give their number back by clearing `seat_number`.
+    """
+
+    def __init__(self):
+        self._maps: Dict[int, SeatMap] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, db, airline) -> SeatMap:
+        rows = db.query(Booking.seat_number).filter(
+            Booking.airline_id == airline.airline_id,
+            Booking.seat_number.isnot(None)
+        )
+        return SeatMap(airline.capacity or 1, (r[0] for r in rows))
+
+    def seat_map(self, db, airline) -> SeatMap:
+        with self._lock:
+            seat_map = self._maps.get(airline.airline_id)
+        if seat_map is None:
+            loaded = self._load(db, airline)
+            with self._lock:
+                seat_map = self._maps.setdefault(airline.airline_id, loaded)
+        return seat_map
+
+    def allocate(self, db, airline, seat_number: Optional[int] = None) -> Optional[int]:
+        """Take `seat_number` (or the lowest free seat); None if it cannot be had."""
+        seat_map = self.seat_map(db, airline)
+        with self._lock:
+            if seat_number:
+                return seat_number if seat_map.take(seat_number) else None
+            return seat_map.allocate()
+
+    def allocate_many(self, db, airline, requested: List[Optional[int]],
+                      contiguous: bool = True) -> Tuple[List[int], List[int]]:
+        """All-or-nothing seating for a group; `requested` holds a seat or None per passenger.
+
+        Requested seats are taken first and the rest are seated together when
+        `contiguous` allows. Returns (seats, []) on success, or ([], indexes of
+        the passengers that could not be seated) with nothing kept.
+        """
+        seat_map = self.seat_map(db, airline)
+        with self._lock:
+            took = [seat_map.take(seat) if seat else None for seat in requested]
+            taken = [seat for seat, ok in zip(requested, took) if ok]
+            failed = [i for i, ok in enumerate(took) if ok is False]
+            open_slots = [i for i, seat in enumerate(requested) if not seat]
+            assigned = []
+            if not failed and open_slots:
+                assigned = seat_map.allocate_seats(len(open_slots), contiguous)
+                if not assigned:
+                    failed = open_slots
+            if failed:
+                for seat in taken:
+                    seat_map.release(seat)
+                return [], failed
+            assigned = iter(assigned)
+            return [seat or next(assigned) for seat in requested], []
+
+    def release(self, airline_id: int, seat_number: Optional[int]):
+        if not seat_number:
+            return
+        with self._lock:
+            seat_map = self._maps.get(airline_id)
+            if seat_map is not None:
+                seat_map.release(seat_number)
+
+    def apply(self, airline_id: int, taken: Iterable[int] = (), released: Iterable[int] = ()):
+        """Mirror seats another worker committed into this worker's map, if it has one loaded."""
+        with self._lock:
+            seat_map = self._maps.get(airline_id)
+            if seat_map is None:
+                return
+            for seat in released:
+                seat_map.release(seat)
+            for seat in taken:
+                seat_map.take(seat)
+
+    def invalidate(self, airline_id: Optional[int] = None):
+        """Drop cached maps so they are reloaded from the database on next use."""
+        with self._lock:
+            if airline_id is None:
+                self._maps.clear()
+            else:
+                self._maps.pop(airline_id, None)
+
+
+seat_inventory = SeatInventory()
\ No newline at end of file
@@ -0,0 +1,304 @@
+# bench_booking_funnel.py
+"""Load test of the booking funnel: search -> create -> pay -> confirm/cancel -> receipt.
+
+Seeds a throwaway database (SQLite file in the temp directory by default, or
+any SQLAlchemy URL via --url; every table is dropped and recreated, so never
+point it at real data) with flights and existing bookings, then drives the real FastAPI app from
+concurrent worker threads and records per-endpoint throughput, p50/p95/p99
+latency, lock waits and deadlocks. Results are written as JSON; pass an
+earlier file as --baseline to fail on p95 regressions between releases.
+
+    python benchmarks/bench_booking_funnel.py --workers 8 --iterations 50 --output results.json
+    python benchmarks/bench_booking_funnel.py --baseline results.json
+"""
+import argparse
+import contextvars
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND)
+
+CITIES = ["Hyderabad", "Bengaluru", "Pune", "Delhi", "Kolkata", "Chennai", "Mumbai", "Ahmedabad",
+          "Jaipur", "Goa", "Dubai", "Singapore"]
+OPERATORS = ["Air India", "IndiGo", "SpiceJet", "Vistara", "GoAir", "AirAsia", "Emirates"]
+STEPS = ["search", "create", "pay", "confirm", "cancel", "receipt"]
+
+# Which funnel step the current request belongs to; Starlette copies the
+# context into the threadpool, so DB error events can be attributed to it
+current_step = contextvars.ContextVar("current_step", default="other")
+
+
+def classify_db_error(error):
+    """'deadlock', 'lock_wait' or None for a DBAPI exception from any of our backends."""
+    code = error.args[0] if getattr(error, "args", None) else None
+    message = str(error).lower()
+    if code == 1213 or "deadlock" in message:
+        return "deadlock"
+    if code == 1205 or "lock wait timeout" in message or "database is locked" in message or "lock timeout" in message:
+        return "lock_wait"
+    return None
+
+
+def seed(engine, flights, bookings, seed_value):
+    import models
+    from models import Airline, Booking
+
+    rnd = random.Random(seed_value)
+    models.Base.metadata.drop_all(engine)
+    models.Base.metadata.create_all(engine)
+    now = datetime.now().replace(microsecond=0)
+    flight_rows = []
+    for i in range(flights):
+        origin, destination = rnd.sample(CITIES, 2)
+        departure = now + timedelta(hours=rnd.randrange(6, 30 * 24))
+        capacity = rnd.choice([150, 180, 200, 220, 250])
+        flight_rows.append({
+            "airline_code": f"BF{i:06d}",
+            "origin_city": origin,
+            "destination_city": destination,
+            "departure_time": departure,
+            "arrival_time": departure + timedelta(minutes=rnd.randrange(60, 600)),
+            "ticket_price": rnd.randrange(3000, 20000),
+            "capacity": capacity,
+            "available_seats": capacity,
+            "operator_name": rnd.choice(OPERATORS),
+        })
+
+    # Spread existing bookings over the flights, seats 1..n in order
+    taken = defaultdict(int)
+    booking_rows = []
+    for i in range(bookings):
+        flight = rnd.randrange(flights)
+        if taken[flight] >= flight_rows[flight]["capacity"] - 1:
+            continue
+        taken[flight] += 1
+        booking_rows.append({
+            "pnr": f"SEED{i:08d}",
+            "airline_id": flight + 1,
+            "passenger_name": f"Seeded Passenger {i}",
+            "seat_number": taken[flight],
+            "price": flight_rows[flight]["ticket_price"],
+            "status": rnd.choice(["PAID", "PAID", "CONFIRMED", "PENDING"]),
+            "created_at": now,
+            "updated_at": now,
+        })
+    for flight, count in taken.items():
+        flight_rows[flight]["available_seats"] -= count
+
+    with engine.begin() as conn:
+        for offset in range(0, len(flight_rows), 5000):
+            conn.execute(Airline.__table__.insert(), flight_rows[offset:offset + 5000])
+        for offset in range(0, len(booking_rows), 5000):
+            conn.execute(Booking.__table__.insert(), booking_rows[offset:offset + 5000])
+    return flight_rows
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.db_errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, step, status_code, seconds):
+        with self._lock:
+            self.latencies[step].append(seconds * 1000)
+            self.statuses[step][status_code] += 1
+
+    def db_error(self, step, kind):
+        with self._lock:
+            self.db_errors[step][kind] += 1
+
+    def summary(self, wall_seconds):
+        endpoints = {}
+        for step in STEPS:
+            timings = sorted(self.latencies.get(step, ()))
+            if not timings:
+                continue
+            statuses = self.statuses[step]
+            endpoints[step] = {
+                "requests": len(timings),
+                "throughput_rps": round(len(timings) / wall_seconds, 2),
+                "p50_ms": round(percentile(timings, 0.50), 3),
+                "p95_ms": round(percentile(timings, 0.95), 3),
+                "p99_ms": round(percentile(timings, 0.99), 3),
+                "mean_ms": round(statistics.fmean(timings), 3),
+                "max_ms": round(timings[-1], 3),
+                "server_errors": sum(n for code, n in statuses.items() if code >= 500),
+                "conflicts": statuses.get(409, 0),
+                "statuses": {str(code): n for code, n in sorted(statuses.items())},
+                "lock_waits": self.db_errors[step].get("lock_wait", 0),
+                "deadlocks": self.db_errors[step].get("deadlock", 0),
+            }
+        return endpoints
+
+
+def run_funnel(client, recorder, flights, iterations, cancel_ratio, receipt_ratio, rnd):
+    def call(step, method, url, **kw):
+        started = time.perf_counter()
+        response = client.request(method, url, headers={"X-Bench-Step": step}, **kw)
+        recorder.record(step, response.status_code, time.perf_counter() - started)
+        return response
+
+    for i in range(iterations):
+        flight = rnd.choice(flights)
+        params = {
+            "origin_city": flight["origin_city"],
+            "destination_city": flight["destination_city"],
+            "departure_time": flight["departure_time"].strftime("%Y-%m-%d"),
+        }
+        sort_by = rnd.choice([None, "price", "duration"])
+        if sort_by:
+            params["sort_by"] = sort_by
+        found = call("search", "GET", "/search", params=params)
+        if found.status_code != 200:
+            continue
+        chosen = rnd.choice(found.json())
+        created = call("create", "POST", "/bookings/create", json={
+            "airline_code": chosen["airline_code"],
+            "passenger_name": f"Bench Passenger {threading.get_ident()}-{i}",
+            "quote": chosen.get("quote"),
+        })
+        if created.status_code != 201:
+            continue
+        pnr = created.json()["pnr"]
+        paid = call("pay", "POST", f"/bookings/{pnr}/pay")
+        if paid.status_code == 200 and paid.json().get("success"):
+            if rnd.random() < cancel_ratio:
+                call("cancel", "POST", f"/bookings/{pnr}/cancel")
+            else:
+                call("confirm", "POST", f"/bookings/{pnr}/confirm")
+        if rnd.random() < receipt_ratio:
+            call("receipt", "GET", f"/bookings/{pnr}/receipt")
+
+
+def compare(results, baseline, tolerance):
+    """Endpoints whose p95 grew by more than `tolerance` (a fraction) over the baseline."""
+    regressions = []
+    for step, current in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(step)
+        if not before or not before.get("p95_ms"):
+            continue
+        change = current["p95_ms"] / before["p95_ms"] - 1
+        print(f"{step:8s} p95 {before['p95_ms']:9.3f} ms -> {current['p95_ms']:9.3f} ms ({change:+.1%})")
+        if change > tolerance:
+            regressions.append(step)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_funnel.db"))
+    parser.add_argument("--flights", type=int, default=2000)
+    parser.add_argument("--bookings", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=50, help="funnels per worker")
+    parser.add_argument("--cancel-ratio", type=float, default=0.2)
+    parser.add_argument("--receipt-ratio", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--output", default="bench_booking_funnel.json")
+    parser.add_argument("--baseline", help="earlier results JSON to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth before failing")
+    args = parser.parse_args()
+
+    # db_config reads the URL at import time
+    os.environ["DATABASE_URL"] = args.url
+    from sqlalchemy import event
+    from fastapi.testclient import TestClient
+    import backend
+    from db_config import engine, pool_metrics
+    from models import Airline
+    from receipt_service import receipt_service
+    from search_cache import search_cache
+
+    if args.skip_seed:
+        with engine.connect() as conn:
+            flights = [dict(r._mapping) for r in conn.execute(Airline.__table__.select())]
+    else:
+        started = time.perf_counter()
+        flights = seed(engine, args.flights, args.bookings, args.seed)
+        print(f"seeded {args.flights} flights and {args.bookings} bookings in {time.perf_counter() - started:.1f}s")
+
+    recorder = Recorder()
+
+    @event.listens_for(engine, "handle_error")
+    def _count_lock_errors(context):
+        kind = classify_db_error(context.original_exception)
+        if kind:
+            recorder.db_error(current_step.get(), kind)
+
+    async def app(scope, receive, send):
+        step = dict(scope.get("headers") or ()).get(b"x-bench-step", b"other").decode()
+        token = current_step.set(step)
+        try:
+            await backend.app(scope, receive, send)
+        finally:
+            current_step.reset(token)
+
+    # No `with TestClient(...)`: startup would launch the market scheduler mid-run
+    def worker(index):
+        client = TestClient(app, raise_server_exceptions=False)
+        run_funnel(client, recorder, flights, args.iterations, args.cancel_ratio, args.receipt_ratio,
+                   random.Random(args.seed + index))
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    receipt_service.shutdown()
+
+    endpoints = recorder.summary(wall)
+    results = {
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "database": engine.dialect.name,
+        "config": {k: v for k, v in vars(args).items() if k not in ("baseline", "output", "skip_seed")},
+        "wall_seconds": round(wall, 3),
+        "funnels_per_second": round(args.workers * args.iterations / wall, 2),
+        "endpoints": endpoints,
+        "lock_waits": sum(e["lock_waits"] for e in endpoints.values()),
+        "deadlocks": sum(e["deadlocks"] for e in endpoints.values()),
+        "pool": pool_metrics(engine),
+        "search_cache": search_cache.stats(),
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"\n{args.workers} workers x {args.iterations} funnels in {wall:.1f}s "
+          f"({results['funnels_per_second']} funnels/s), lock waits {results['lock_waits']}, "
+          f"deadlocks {results['deadlocks']}")
+    for step, e in endpoints.items():
+        print(f"{step:8s} n={e['requests']:6d} {e['throughput_rps']:8.1f} req/s  p50 {e['p50_ms']:8.3f}  "
+              f"p95 {e['p95_ms']:8.3f}  p99 {e['p99_ms']:8.3f} ms  5xx {e['server_errors']}  409 {e['conflicts']}")
+    print(f"results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"p95 regressed more than {args.tolerance:.0%} on: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
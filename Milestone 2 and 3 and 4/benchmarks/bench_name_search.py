@@ -0,0 +1,159 @@
+# bench_name_search.py
+"""Passenger-name lookups on /bookings with and without the in-process trigram index.
+
+Seeds a throwaway database (SQLite file in the temp directory by default, or
+any SQLAlchemy URL via --url; the bookings table is dropped and recreated, so
+never point it at real data) with synthetic passenger names, builds
+backend/name_index.py and times substring and prefix queries through the
+real endpoint, first answered from the index and then by the old
+ILIKE '%name%' scan (NAME_INDEX off). Also reports the build time, index
+size and the cost of indexing a newly booked name.
+
+    python benchmarks/bench_name_search.py --bookings 5000000
+    python benchmarks/bench_name_search.py --skip-seed --scan-queries 3
+"""
+import argparse
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+FIRST = ["Aarav", "Aditi", "Akash", "Ananya", "Anil", "Anjali", "Arjun", "Asha", "Deepak", "Divya", "Farhan",
+         "Gaurav", "Harini", "Ishaan", "Jaya", "Karan", "Kavya", "Lakshmi", "Manoj", "Meera", "Mohan", "Nandini",
+         "Neha", "Nikhil", "Pooja", "Pranav", "Priya", "Rahul", "Rajesh", "Ravi", "Riya", "Rohan", "Sai", "Sanjay",
+         "Shreya", "Sita", "Sneha", "Suresh", "Tanvi", "Varun", "Vikram", "Zoya", "John", "Maria", "Ahmed",
+         "Chen", "Fatima", "Olga", "José", "Zoë"]
+LAST = ["Sharma", "Verma", "Iyer", "Nair", "Reddy", "Khan", "Das", "Patel", "Gupta", "Menon", "Pillai", "Rao",
+        "Singh", "Kumar", "Chatterjee", "Banerjee", "Mukherjee", "Joshi", "Kulkarni", "Deshpande", "Agarwal",
+        "Bhat", "Naidu", "Shetty", "Kapoor", "Malhotra", "Chopra", "Mehta", "Shah", "Desai", "Fernandes",
+        "D'Souza", "Thomas", "George", "Mathew", "Smith", "Garcia", "Müller", "Ivanova", "Wang"]
+SYLLABLES = ["ka", "ra", "mi", "to", "shi", "na", "vel", "dor", "an", "th", "pu", "ji", "lo", "ve", "sa", "qu"]
+BATCH = 50000
+
+
+def passenger_name(rnd):
+    """First and last name, sometimes a middle name made of random syllables, so grams vary."""
+    parts = [rnd.choice(FIRST)]
+    if rnd.random() < 0.5:
+        parts.append("".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))).title())
+    parts.append(rnd.choice(LAST))
+    return " ".join(parts)
+
+
+def seed(engine, bookings, seed_value):
+    from models import Booking
+
+    rnd = random.Random(seed_value)
+    table = Booking.__table__
+    table.drop(engine, checkfirst=True)
+    table.create(engine)
+    now = datetime.now().replace(microsecond=0)
+    with engine.begin() as conn:
+        for offset in range(0, bookings, BATCH):
+            conn.execute(table.insert(), [{
+                "pnr": f"NAME{i:09d}",
+                "airline_id": 1 + i % 1000,
+                "passenger_name": passenger_name(rnd),
+                "price": 5000,
+                "status": "PAID",
+                "created_at": now,
+                "updated_at": now,
+            } for i in range(offset, min(bookings, offset + BATCH))])
+
+
+def time_requests(client, params_list):
+    timings, rows = [], 0
+    for params in params_list:
+        started = time.perf_counter()
+        response = client.get("/bookings", params=params)
+        timings.append((time.perf_counter() - started) * 1000)
+        rows += len(response.json())
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[max(0, int(len(timings) * 0.95) - 1)], 3),
+        "mean_rows": round(rows / len(params_list), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_names.db"))
+    parser.add_argument("--bookings", type=int, default=5000000)
+    parser.add_argument("--queries", type=int, default=100, help="index queries per case")
+    parser.add_argument("--scan-queries", type=int, default=5, help="ILIKE scan queries per case (slow)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    # db_config reads the URL at import time
+    os.environ["DATABASE_URL"] = args.url
+    from fastapi.testclient import TestClient
+    import backend
+    from db_config import SessionLocal, engine
+    from name_index import booking_names
+
+    if not args.skip_seed:
+        started = time.perf_counter()
+        seed(engine, args.bookings, args.seed)
+        print(f"seeded {args.bookings} bookings in {time.perf_counter() - started:.1f}s")
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        booking_names.ensure_fresh(db)
+        build = time.perf_counter() - started
+    finally:
+        db.close()
+    stats = booking_names.stats()
+    print(f"index built in {build:.1f}s: {stats['postings']} postings over {stats['grams']} grams, "
+          f"{stats['bytes'] / 2 ** 20:.0f} MiB, peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+    rnd = random.Random(7)
+    names = [passenger_name(rnd) for _ in range(args.queries)]
+
+    def fragment(length):
+        def pick(name):
+            start = rnd.randrange(max(1, len(name) - length + 1))
+            return name[start:start + length]
+        return pick
+
+    cases = [
+        ("substring, 3 chars", fragment(3), "substring"),
+        ("substring, 5 chars", fragment(5), "substring"),
+        ("substring, last name", lambda name: name.split()[-1], "substring"),
+        ("substring, full name", lambda name: name, "substring"),
+        ("prefix, 1 char", lambda name: name[:1], "prefix"),
+        ("prefix, 2 chars", lambda name: name[:2], "prefix"),
+        ("prefix, 4 chars", lambda name: name[:4], "prefix"),
+    ]
+    # No `with TestClient(...)`: startup would launch the background schedulers
+    client = TestClient(backend.app)
+    print(f"\n{'case':24s} {'index p50':>11s} {'p95':>10s} {'rows':>7s}   {'ILIKE p50':>11s} {'p95':>10s}")
+    for label, pick, match in cases:
+        params = [{"passenger_name": pick(name), "name_match": match} for name in names]
+        backend.NAME_INDEX = True
+        indexed = time_requests(client, params)
+        backend.NAME_INDEX = False
+        scanned = time_requests(client, params[:args.scan_queries])
+        backend.NAME_INDEX = True
+        print(f"{label:24s} {indexed['p50_ms']:8.3f} ms {indexed['p95_ms']:7.3f} ms {indexed['mean_rows']:7.1f}   "
+              f"{scanned['p50_ms']:8.3f} ms {scanned['p95_ms']:7.3f} ms")
+
+    new_names = [passenger_name(rnd) for _ in range(10000)]
+    first_id = booking_names.stats()["max_id"] + 1
+    started = time.perf_counter()
+    for offset, name in enumerate(new_names):
+        booking_names.add(first_id + offset, name)
+    per_insert = (time.perf_counter() - started) / len(new_names) * 1e6
+    print(f"\nindexing a new booking: {per_insert:.1f} us each ({booking_names.stats()['merges']} merges)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# bench_search_indexes.py
+"""Plan and latency of /search and airline_code lookups before and after the airlines indexes.
+
+Seeds a throwaway database (SQLite file in the temp directory by default, or
+any SQLAlchemy URL via --url) with synthetic flights, then times the old
+`DATE(departure_time) = ?` search and the half-open range search with and
+without db/migrations/001_airlines_search_indexes.sql applied.
+
+    python benchmarks/bench_search_indexes.py --flights 500000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from sqlalchemy import create_engine, func, insert, select, text  # noqa: E402
+
+from models import Airline  # noqa: E402
+
+CITIES = ["Hyderabad", "Bengaluru", "Pune", "Delhi", "Kolkata", "Chennai", "Mumbai", "Ahmedabad",
+          "Jaipur", "Goa", "Dubai", "Singapore", "Kuala Lumpur", "Colombo", "London", "Vijayawada",
+          "Lucknow", "Kochi", "Bhopal", "Nagpur"]
+OPERATORS = ["Air India", "IndiGo", "SpiceJet", "Vistara", "GoAir", "AirAsia", "Emirates"]
+START = datetime(2025, 1, 1)
+airlines = Airline.__table__
+
+
+def seed(engine, flights, batch=10000, seed_value=42):
+    rnd = random.Random(seed_value)
+    airlines.drop(engine, checkfirst=True)
+    airlines.create(engine)
+    with engine.begin() as conn:
+        for offset in range(0, flights, batch):
+            rows = []
+            for i in range(offset, min(flights, offset + batch)):
+                origin, destination = rnd.sample(CITIES, 2)
+                departure = START + timedelta(minutes=rnd.randrange(365 * 24 * 60))
+                capacity = rnd.choice([150, 180, 200, 220, 250])
+                rows.append({
+                    "airline_code": f"BX{i:07d}",
+                    "origin_city": origin,
+                    "destination_city": destination,
+                    "departure_time": departure,
+                    "arrival_time": departure + timedelta(minutes=rnd.randrange(60, 600)),
+                    "ticket_price": rnd.randrange(3000, 50000),
+                    "capacity": capacity,
+                    "available_seats": rnd.randrange(capacity + 1),
+                    "operator_name": rnd.choice(OPERATORS),
+                })
+            conn.execute(insert(airlines), rows)
+
+
+def date_search(origin, destination, day):
+    return select(airlines).where(airlines.c.origin_city == origin,
+                                  airlines.c.destination_city == destination,
+                                  func.date(airlines.c.departure_time) == day)
+
+
+def range_search(origin, destination, day):
+    start = datetime.combine(day, datetime.min.time())
+    return select(airlines).where(airlines.c.origin_city == origin,
+                                  airlines.c.destination_city == destination,
+                                  airlines.c.departure_time >= start,
+                                  airlines.c.departure_time < start + timedelta(days=1))
+
+
+def code_lookup(code):
+    return select(airlines).where(airlines.c.airline_code == code)
+
+
+def explain(conn, stmt):
+    sql = str(stmt.compile(conn.engine, compile_kwargs={"literal_binds": True}))
+    prefix = "EXPLAIN QUERY PLAN " if conn.engine.dialect.name == "sqlite" else "EXPLAIN "
+    return [" | ".join(str(c) for c in row) for row in conn.execute(text(prefix + sql))]
+
+
+def time_queries(conn, statements):
+    timings = []
+    for stmt in statements:
+        started = time.perf_counter()
+        conn.execute(stmt).all()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+    }
+
+
+def run_cases(conn, cases, label):
+    print(f"\n== {label} ==")
+    for name, build, params in cases:
+        print(f"{name}: {time_queries(conn, [build(*p) for p in params])}")
+        for line in explain(conn, build(*params[0])):
+            print(f"    plan: {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_search.db"))
+    parser.add_argument("--flights", type=int, default=500000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    if not args.skip_seed:
+        started = time.perf_counter()
+        seed(engine, args.flights)
+        print(f"seeded {args.flights} flights in {time.perf_counter() - started:.1f}s")
+
+    rnd = random.Random(7)
+    searches = [(*rnd.sample(CITIES, 2), (START + timedelta(days=rnd.randrange(365))).date())
+                for _ in range(args.queries)]
+    codes = [(f"BX{rnd.randrange(args.flights):07d}",) for _ in range(args.queries)]
+    cases = [
+        ("search DATE(departure_time) = day", date_search, searches),
+        ("search departure_time in [day, day+1)", range_search, searches),
+        ("lookup by airline_code", code_lookup, codes),
+    ]
+
+    indexes = [i for i in airlines.indexes if i.name in ("ix_airlines_route_departure", "ux_airlines_airline_code")]
+    for index in indexes:
+        index.drop(engine, checkfirst=True)
+    with engine.connect() as conn:
+        run_cases(conn, cases, "before: no indexes")
+    for index in indexes:
+        index.create(engine)
+    with engine.connect() as conn:
+        run_cases(conn, cases, "after: 001_airlines_search_indexes")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
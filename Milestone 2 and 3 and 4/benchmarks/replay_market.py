@@ -0,0 +1,68 @@
+# replay_market.py
+"""Replay market ticks offline against a snapshot of the airlines table.
+
+Reads every flight's fare, capacity, seats and departure once (read only;
+--url defaults to DATABASE_URL), then runs backend/market_replay.py: the
+live tick's seat moves and pricing with a seeded RNG and a virtual clock,
+entirely in memory. Fare and seat trajectories are written as CSV, or as
+Parquet when --output ends in .parquet (needs pyarrow). The same --seed,
+--start and snapshot reproduce the same file.
+
+    python benchmarks/replay_market.py --ticks 2016 --seed 7 --output week.csv
+    python benchmarks/replay_market.py --ticks 5000 --seat-changes=-3,-1,0,1 --reprice-from base --output demand.parquet
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="SQLAlchemy URL to snapshot flights from (default: DATABASE_URL)")
+    parser.add_argument("--ticks", type=int, default=2016, help="ticks to replay (2016 x 300 s = one week)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        help="virtual clock start, e.g. 2025-01-01T06:00 (default: now, to the minute)")
+    parser.add_argument("--tick-seconds", type=float, help="virtual seconds per tick (default: MARKET_INTERVAL_SECONDS)")
+    parser.add_argument("--seat-changes", help="comma-separated seat moves drawn uniformly per flight and tick "
+                                               "(default: the live simulator's -2,-1,0,0,1)")
+    parser.add_argument("--reprice-from", choices=["current", "base"], default="current",
+                        help="price each tick off the last fare like the live tick, or off the snapshot fare")
+    parser.add_argument("--output", default="market_replay.csv", help=".csv or .parquet")
+    args = parser.parse_args()
+
+    # db_config reads the URL at import time
+    if args.url:
+        os.environ["DATABASE_URL"] = args.url
+    from db_config import SessionLocal
+    from market_replay import MarketReplay, open_trajectory
+
+    options = {"seed": args.seed, "start": args.start, "reprice_from": args.reprice_from}
+    if args.tick_seconds:
+        options["tick_seconds"] = args.tick_seconds
+    if args.seat_changes:
+        options["seat_changes"] = [int(move) for move in args.seat_changes.split(",")]
+
+    db = SessionLocal()
+    try:
+        replay = MarketReplay.from_db(db, **options)
+    finally:
+        db.close()
+    print(f"snapshot of {len(replay.airline_ids)} flights, replaying {args.ticks} ticks from {replay.start}")
+
+    trajectory = open_trajectory(args.output)
+    try:
+        stats = replay.run(args.ticks, trajectory)
+    finally:
+        trajectory.close()
+    stats["rows_written"] = trajectory.rows
+    print(json.dumps(stats, indent=2))
+    print(f"trajectories written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# stress_seat_concurrency.py
+"""Overbooking stress test for the lock and optimistic seat concurrency modes.
+
+Several processes (each with its own seat map cache, like uvicorn workers)
+run threads that hammer /bookings/create and /bookings/{pnr}/cancel on a
+few small flights, far beyond their capacity. Afterwards every flight must
+satisfy: no seat number held twice, seated bookings <= capacity, and
+available_seats == capacity - seated bookings. Exits non-zero on any
+violation. The database is dropped and recreated, so use a throwaway one
+(the default is a SQLite file in the temp directory).
+SQLite ignores FOR UPDATE, so there the lock mode is expected to show lost
+updates of available_seats; run it against MySQL to compare both modes.
+
+    python benchmarks/stress_seat_concurrency.py --mode both
+    python benchmarks/stress_seat_concurrency.py --mode optimistic --url mysql+pymysql://root:pw@localhost/stress
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND)
+
+
+def seed(url, flights, capacity):
+    from sqlalchemy import create_engine
+    import models
+
+    engine = create_engine(url)
+    models.Base.metadata.drop_all(engine)
+    models.Base.metadata.create_all(engine)
+    departure = datetime.now() + timedelta(days=2)
+    with engine.begin() as conn:
+        conn.execute(models.Airline.__table__.insert(), [{
+            "airline_code": f"ST{i:03d}",
+            "origin_city": "Hyderabad",
+            "destination_city": "Delhi",
+            "departure_time": departure,
+            "arrival_time": departure + timedelta(hours=2),
+            "ticket_price": 5000,
+            "capacity": capacity,
+            "available_seats": capacity,
+            "operator_name": "IndiGo",
+        } for i in range(flights)])
+    engine.dispose()
+    return [f"ST{i:03d}" for i in range(flights)]
+
+
+def run_process(url, mode, codes, threads, attempts, cancel_ratio, seed_value):
+    """One worker process: `threads` clients booking and cancelling; returns status counts."""
+    os.environ["DATABASE_URL"] = url
+    os.environ["SEAT_CONCURRENCY"] = mode
+    os.environ["METRICS_ENABLED"] = "0"
+    sys.path.insert(0, BACKEND)
+    from fastapi.testclient import TestClient
+    import backend
+
+    counts = Counter()
+    lock = threading.Lock()
+
+    def client_loop(index):
+        rnd = random.Random(seed_value * 1000 + index)
+        client = TestClient(backend.app, raise_server_exceptions=False)
+        local = Counter()
+        for i in range(attempts):
+            response = client.post("/bookings/create", json={
+                "airline_code": rnd.choice(codes),
+                "passenger_name": f"Stress {seed_value}-{index}-{i}",
+            })
+            local[f"create_{response.status_code}"] += 1
+            if response.status_code == 201 and rnd.random() < cancel_ratio:
+                cancelled = client.post(f"/bookings/{response.json()['pnr']}/cancel")
+                local[f"cancel_{cancelled.status_code}"] += 1
+        with lock:
+            counts.update(local)
+
+    workers = [threading.Thread(target=client_loop, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return dict(counts)
+
+
+def check_invariants(url):
+    from sqlalchemy import create_engine, func, select
+    from models import Airline, Booking
+
+    engine = create_engine(url)
+    violations, flights = [], []
+    with engine.connect() as conn:
+        for airline in conn.execute(select(Airline.__table__)).all():
+            seats = [r[0] for r in conn.execute(
+                select(Booking.seat_number).where(Booking.airline_id == airline.airline_id,
+                                                  Booking.seat_number.isnot(None)))]
+            live = conn.execute(select(func.count()).select_from(Booking.__table__).where(
+                Booking.airline_id == airline.airline_id,
+                Booking.status.in_(["PENDING", "CONFIRMED", "PAID"]))).scalar()
+            doubles = [seat for seat, n in Counter(seats).items() if n > 1]
+            flight = {"airline_code": airline.airline_code, "capacity": airline.capacity,
+                      "available_seats": airline.available_seats, "seated": len(seats), "live": live}
+            flights.append(flight)
+            if doubles:
+                violations.append(f"{airline.airline_code}: seats held twice {doubles}")
+            if len(seats) > airline.capacity:
+                violations.append(f"{airline.airline_code}: {len(seats)} seated on {airline.capacity} seats")
+            if airline.available_seats != airline.capacity - len(seats):
+                violations.append(f"{airline.airline_code}: available_seats {airline.available_seats} "
+                                  f"!= capacity {airline.capacity} - seated {len(seats)}")
+            if live != len(seats):
+                violations.append(f"{airline.airline_code}: {live} live bookings but {len(seats)} seats held")
+    engine.dispose()
+    return flights, violations
+
+
+def run_mode(args, mode):
+    codes = seed(args.url, args.flights, args.capacity)
+    context = multiprocessing.get_context("spawn")
+    started = time.perf_counter()
+    with context.Pool(args.processes) as pool:
+        results = pool.starmap(run_process, [
+            (args.url, mode, codes, args.threads, args.attempts, args.cancel_ratio, args.seed + p)
+            for p in range(args.processes)
+        ])
+    elapsed = time.perf_counter() - started
+    counts = Counter()
+    for result in results:
+        counts.update(result)
+    flights, violations = check_invariants(args.url)
+    return {
+        "mode": mode,
+        "seconds": round(elapsed, 3),
+        "bookings_per_second": round(counts.get("create_201", 0) / elapsed, 1),
+        "requests": dict(sorted(counts.items())),
+        "flights": flights,
+        "violations": violations,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///" + os.path.join(tempfile.gettempdir(), "stress_seats.db"))
+    parser.add_argument("--mode", choices=["lock", "optimistic", "both"], default="both")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8, help="clients per process")
+    parser.add_argument("--attempts", type=int, default=30, help="bookings tried per client")
+    parser.add_argument("--flights", type=int, default=3)
+    parser.add_argument("--capacity", type=int, default=60)
+    parser.add_argument("--cancel-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    # SEAT_CONCURRENCY is read at import, so each mode runs in fresh processes
+    results = []
+    for mode in (["lock", "optimistic"] if args.mode == "both" else [args.mode]):
+        result = run_mode(args, mode)
+        results.append(result)
+        print(f"\n== {mode} ==  {result['seconds']}s, {result['bookings_per_second']} bookings/s")
+        print(f"requests: {result['requests']}")
+        for flight in result["flights"]:
+            print(f"  {flight}")
+        for violation in result["violations"]:
+            print(f"  VIOLATION {violation}")
+        if not result["violations"]:
+            print("  no overbooking")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if any(r["violations"] for r in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
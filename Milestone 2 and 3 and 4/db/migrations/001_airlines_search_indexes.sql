@@ -0,0 +1,10 @@
+-- 001_airlines_search_indexes.sql
+-- Indexes for /search (route + departure range) and every airline_code lookup
+-- (/dynamic_price, /book, /bookings/create, /external_api).
+use mydb;
+
+ALTER TABLE airlines
+    ADD INDEX ix_airlines_route_departure (origin_city, destination_city, departure_time),
+    ADD UNIQUE INDEX ux_airlines_airline_code (airline_code);
+
+SHOW INDEX FROM airlines;
\ No newline at end of file
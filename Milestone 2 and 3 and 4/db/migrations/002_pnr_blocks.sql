@@ -0,0 +1,10 @@
+-- 002_pnr_blocks.sql
+-- Counter blocks leased by backend/pnr_allocator.py; one row per PNR sequence.
+use mydb;
+
+CREATE TABLE IF NOT EXISTS pnr_blocks (
+    name VARCHAR(20) PRIMARY KEY,
+    next_value BIGINT NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT IGNORE INTO pnr_blocks (name, next_value) VALUES ('bookings', 1);
\ No newline at end of file
@@ -0,0 +1,17 @@
+-- 003_fare_rollups.sql
+-- Minute/hour/day OHLC of fare ticks per flight, maintained by backend/fare_store.py
+-- and read by /fares/{airline_code}/history. Times are UTC, like fare_history.changed_at.
+use mydb;
+
+CREATE TABLE IF NOT EXISTS fare_rollups (
+    flight_id INT NOT NULL,
+    resolution VARCHAR(6) NOT NULL,
+    bucket_start DATETIME NOT NULL,
+    open_price DECIMAL(10,2) NOT NULL,
+    high_price DECIMAL(10,2) NOT NULL,
+    low_price DECIMAL(10,2) NOT NULL,
+    close_price DECIMAL(10,2) NOT NULL,
+    ticks INT NOT NULL,
+    PRIMARY KEY (flight_id, resolution, bucket_start),
+    INDEX ix_fare_rollups_resolution_bucket (resolution, bucket_start)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
\ No newline at end of file
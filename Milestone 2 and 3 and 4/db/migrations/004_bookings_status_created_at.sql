@@ -0,0 +1,6 @@
+-- 004_bookings_status_created_at.sql
+-- Lets the PENDING-booking sweeper (backend/booking_sweeper.py) find expired holds
+-- by (status, created_at) instead of scanning every booking.
+use mydb;
+
+ALTER TABLE bookings ADD INDEX ix_bookings_status_created_at (status, created_at);
\ No newline at end of file
@@ -0,0 +1,8 @@
+-- 005_bookings_pnr_key_name.sql
+-- Names the unique PNR key so backend.py can tell a PNR clash (retried with a new
+-- PNR) from a seat clash in MySQL's duplicate-key errors.
+use mydb;
+
+ALTER TABLE bookings RENAME INDEX pnr TO ux_bookings_pnr;
+
+SHOW INDEX FROM bookings;
\ No newline at end of file
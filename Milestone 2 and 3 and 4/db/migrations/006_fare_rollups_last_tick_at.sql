@@ -0,0 +1,10 @@
+-- 006_fare_rollups_last_tick_at.sql
+-- Records when the tick behind each rollup's close_price happened, so backend/fare_store.py
+-- only replaces the close with a later one. Existing rows start at their bucket start.
+use mydb;
+
+ALTER TABLE fare_rollups ADD COLUMN last_tick_at DATETIME NULL;
+UPDATE fare_rollups SET last_tick_at = bucket_start WHERE last_tick_at IS NULL;
+ALTER TABLE fare_rollups MODIFY last_tick_at DATETIME NOT NULL;
+
+SHOW COLUMNS FROM fare_rollups;
\ No newline at end of file
@@ -42,9 +42,9 @@ async function searchFlights() {
         <h3>${flight.origin_city} → ${flight.destination_city}</h3>
         <p>✈️ Airline: <b>${flight.operator_name}</b> (${flight.airline_code})</p>
         <p>🕒 Departure: ${flight.departure_time}</p>
-        <p>💰 Price: ₹${flight.ticket_price}</p>
+        <p>💰 Price: ₹${flight.dynamic_price ?? flight.ticket_price}</p>
         <p>🪑 Seats Left: ${flight.available_seats}</p>
-        <button onclick="goToBooking('${flight.airline_code}')">Book Now</button>
+        <button onclick="goToBooking('${flight.airline_code}', '${flight.quote || ""}')">Book Now</button>
       `;
       resultsDiv.appendChild(card);
     });
@@ -57,8 +57,9 @@ async function searchFlights() {
 // -----------------------------------------------------
 // 🔹 Navigate to Booking Page
 // -----------------------------------------------------
-function goToBooking(airlineCode) {
+function goToBooking(airlineCode, quote) {
   localStorage.setItem("selected_airline", airlineCode);
+  localStorage.setItem("selected_quote", quote || "");
   window.location.href = "booking.html";
 }
 
@@ -81,6 +82,10 @@ async function createBooking(event) {
     passenger_name: document.getElementById("passenger_name").value.trim(),
     contact_number: document.getElementById("contact_number").value.trim(),
   };
+  // Book at the searched price while its quote is valid (only for the flight it was issued for)
+  if (payload.airline_code === localStorage.getItem("selected_airline") && localStorage.getItem("selected_quote")) {
+    payload.quote = localStorage.getItem("selected_quote");
+  }
 
   if (!payload.passenger_name || !payload.contact_number) {
     alert("Please fill in all fields.");